@@ -1,53 +1,191 @@
 import fs from 'node:fs';
+import net from 'node:net';
 import path from 'node:path';
+import readline from 'node:readline';
 
 const ROOT = path.resolve(path.dirname(new URL(import.meta.url).pathname), '..');
 const OUT = path.join(ROOT, 'outputs');
 const OUT_FILE = path.join(OUT, `playwright_trends_${new Date().toISOString().slice(0,10)}.json`);
+const TREND_URL = 'https://trends.google.com/trending?geo=VN';
+const TREND_LIMIT = 30;
+const SETTLE_TIMEOUT_MS = 2500;
 
-async function main() {
-  fs.mkdirSync(OUT, { recursive: true });
+// mỗi trend là 1 hàng trong bảng trending; tiêu đề nằm ở ô thứ 2
+const TREND_ROW_SELECTOR = 'table tbody tr[data-row-id]';
+const TREND_TITLE_SELECTOR = 'td:nth-child(2) div';
+
+// chạy trong page: lấy tiêu đề từ các hàng trend, bỏ qua header/nav
+function pickTrends([limit, rowSelector, titleSelector]) {
+  const out = [];
+  const seen = new Set();
+  for (const row of document.querySelectorAll(rowSelector)) {
+    const el = row.querySelector(titleSelector);
+    const t = ((el || row).innerText || '').split('\n')[0].trim();
+    const key = t.toLowerCase();
+    if (t.length < 2 || t.length > 80 || seen.has(key)) continue;
+    seen.add(key);
+    out.push(t);
+    if (out.length >= limit) break;
+  }
+  return out;
+}
+
+async function launchBrowser(chromium) {
+  return chromium.launch({ headless: true, executablePath: '/usr/bin/chromium-browser' });
+}
+
+async function extractTrends(page, url) {
+  await page.goto(url, { waitUntil: 'domcontentloaded', timeout: 45000 });
+  // chờ hàng trend đầu tiên render thay vì sleep cố định; SETTLE_TIMEOUT_MS chỉ là trần
+  await page.waitForSelector(TREND_ROW_SELECTOR, { timeout: SETTLE_TIMEOUT_MS }).catch(() => {});
+  return page.evaluate(pickTrends, [TREND_LIMIT, TREND_ROW_SELECTOR, TREND_TITLE_SELECTOR]);
+}
 
-  let chromium;
+async function loadChromium() {
   try {
-    ({ chromium } = await import('playwright'));
+    const { chromium } = await import('playwright');
+    return chromium;
   } catch {
+    return null;
+  }
+}
+
+async function runOnce() {
+  fs.mkdirSync(OUT, { recursive: true });
+
+  const chromium = await loadChromium();
+  if (!chromium) {
     // Graceful: if playwright missing, emit empty file and exit 0
     fs.writeFileSync(OUT_FILE, JSON.stringify({ source: 'playwright', trends: [], note: 'playwright package missing' }, null, 2));
     console.log(OUT_FILE);
     return;
   }
 
-  const browser = await chromium.launch({ headless: true, executablePath: '/usr/bin/chromium-browser' });
+  const browser = await launchBrowser(chromium);
   const page = await browser.newPage();
-  await page.goto('https://trends.google.com/trending?geo=VN', { waitUntil: 'domcontentloaded', timeout: 45000 });
-  await page.waitForTimeout(2500);
-
-  const trends = await page.evaluate(() => {
-    const cands = Array.from(document.querySelectorAll('a, div, span'))
-      .map((e) => (e.textContent || '').trim())
-      .filter((t) => t.length >= 4 && t.length <= 80);
-    const out = [];
-    const seen = new Set();
-    for (const t of cands) {
-      const key = t.toLowerCase();
-      if (seen.has(key)) continue;
-      seen.add(key);
-      out.push(t);
-      if (out.length >= 30) break;
-    }
-    return out;
-  });
-
+  const trends = await extractTrends(page, TREND_URL);
   await browser.close();
 
   fs.writeFileSync(OUT_FILE, JSON.stringify({ source: 'playwright', trends }, null, 2));
   console.log(OUT_FILE);
 }
 
-main().catch((e) => {
-  fs.mkdirSync(path.dirname(OUT_FILE), { recursive: true });
-  fs.writeFileSync(OUT_FILE, JSON.stringify({ source: 'playwright', trends: [], error: String(e) }, null, 2));
-  console.log(OUT_FILE);
-  process.exit(0);
-});
+// --serve: giữ browser warm, nhận request JSON từng dòng, trả JSON từng dòng.
+// Mặc định qua stdin/stdout; với `--socket <path>` thì chạy daemon nghe trên unix socket,
+// sống qua nhiều lần chạy pipeline và tự thoát sau DAEMON_IDLE_MS không có request.
+const DAEMON_IDLE_MS = 30 * 60 * 1000;
+
+async function serve(socketPath) {
+  const chromium = await loadChromium();
+  let browser = null;
+  let page = null;
+
+  const ensurePage = async () => {
+    if (browser && browser.isConnected() && page && !page.isClosed()) return page;
+    if (browser) await browser.close().catch(() => {});
+    browser = await launchBrowser(chromium);
+    page = await browser.newPage();
+    return page;
+  };
+
+  const handle = async (req) => {
+    const started = Date.now();
+    if (!chromium) return { id: req.id, trends: [], note: 'playwright package missing' };
+    try {
+      const p = await ensurePage();
+      const trends = await extractTrends(p, req.url || TREND_URL);
+      return { id: req.id, trends, ms: Date.now() - started };
+    } catch (e) {
+      page = null;
+      return { id: req.id, trends: [], error: String(e), ms: Date.now() - started };
+    }
+  };
+
+  // xử lý tuần tự trên cùng 1 page, kể cả khi nhiều client gọi cùng lúc
+  let queue = Promise.resolve();
+  const listen = (input, reply, onIdle) => {
+    const rl = readline.createInterface({ input, terminal: false });
+    rl.on('line', (line) => {
+      let req;
+      try {
+        req = JSON.parse(line);
+      } catch {
+        return;
+      }
+      queue = queue.then(async () => reply(await handle(req)));
+      if (onIdle) queue = queue.then(onIdle);
+    });
+    return rl;
+  };
+
+  const shutdown = async () => {
+    await queue;
+    if (browser) await browser.close().catch(() => {});
+    if (socketPath && ownsSocket()) fs.rmSync(socketPath, { force: true });
+    process.exit(0);
+  };
+
+  if (!socketPath) {
+    const rl = listen(process.stdin, (obj) => process.stdout.write(JSON.stringify(obj) + '\n'));
+    rl.on('close', shutdown);
+    return;
+  }
+
+  // dev+ino của file socket do chính server này tạo: lúc thoát chỉ xoá nếu file vẫn là của mình,
+  // không xoá nhầm socket của daemon khác đã thay chỗ
+  let socketId = null;
+  const ownsSocket = () => {
+    try {
+      const st = fs.statSync(socketPath);
+      return socketId !== null && st.dev === socketId.dev && st.ino === socketId.ino;
+    } catch {
+      return false;
+    }
+  };
+
+  let idleTimer = null;
+  const armIdle = () => {
+    clearTimeout(idleTimer);
+    idleTimer = setTimeout(shutdown, DAEMON_IDLE_MS);
+  };
+  fs.mkdirSync(path.dirname(socketPath), { recursive: true });
+  // đã có daemon khác nghe trên socket (2 lần chạy cùng spawn) -> nhường, không xoá socket đang sống của nó
+  const alive = await new Promise((resolve) => {
+    const probe = net.connect(socketPath);
+    probe.once('connect', () => {
+      probe.destroy();
+      resolve(true);
+    });
+    probe.once('error', () => resolve(false));
+  });
+  if (alive) process.exit(0);
+  // connect thất bại -> file socket còn lại (nếu có) là của daemon đã chết
+  fs.rmSync(socketPath, { force: true });
+  const server = net.createServer((conn) => {
+    clearTimeout(idleTimer);
+    conn.on('error', () => {});
+    listen(conn, (obj) => {
+      if (!conn.destroyed) conn.write(JSON.stringify(obj) + '\n');
+    }, armIdle);
+  });
+  server.on('error', () => process.exit(1));
+  server.listen(socketPath, () => {
+    const st = fs.statSync(socketPath);
+    socketId = { dev: st.dev, ino: st.ino };
+    armIdle();
+  });
+  process.on('SIGTERM', shutdown);
+  process.on('SIGINT', shutdown);
+}
+
+if (process.argv.includes('--serve')) {
+  const i = process.argv.indexOf('--socket');
+  serve(i >= 0 ? process.argv[i + 1] : null);
+} else {
+  runOnce().catch((e) => {
+    fs.mkdirSync(path.dirname(OUT_FILE), { recursive: true });
+    fs.writeFileSync(OUT_FILE, JSON.stringify({ source: 'playwright', trends: [], error: String(e) }, null, 2));
+    console.log(OUT_FILE);
+    process.exit(0);
+  });
+}
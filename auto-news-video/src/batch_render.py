@@ -0,0 +1,115 @@
+import argparse
+import concurrent.futures as cf
+import datetime as dt
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from render_video import render_from_script
+
+ROOT = Path(__file__).resolve().parents[1]
+OUTPUTS = ROOT / "outputs"
+
+THREADS_PER_JOB = 4
+
+
+def _out_stem(script_path: Path) -> str:
+    stem = script_path.stem
+    return stem[len("script_") :] if stem.startswith("script_") else stem
+
+
+def _render_job(script_path: str, out_stem: str, threads: int, retries: int, profile: str | None = None) -> Dict:
+    started = time.monotonic()
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            video = render_from_script(Path(script_path), out_stem=out_stem, threads=threads, profile=profile)
+            return {
+                "script": script_path,
+                "video": str(video),
+                "status": "done",
+                "attempts": attempts,
+                "seconds": round(time.monotonic() - started, 2),
+            }
+        except Exception as e:
+            if attempts > retries:
+                return {
+                    "script": script_path,
+                    "video": None,
+                    "status": "error",
+                    "error": str(e),
+                    "attempts": attempts,
+                    "seconds": round(time.monotonic() - started, 2),
+                }
+
+
+def render_batch(
+    script_paths: List[Path],
+    workers: int | None = None,
+    threads_per_job: int = THREADS_PER_JOB,
+    retries: int = 1,
+    manifest_path: Path | None = None,
+    profile: str | None = None,
+) -> Dict:
+    # mỗi job 1 process ffmpeg với `threads_per_job` thread -> số job song song theo số core
+    cpu = os.cpu_count() or 1
+    threads_per_job = max(1, min(threads_per_job, cpu))
+    workers = workers or max(1, cpu // threads_per_job)
+
+    stems: Dict[str, int] = {}
+    jobs = []
+    for p in script_paths:
+        stem = _out_stem(p)
+        stems[stem] = stems.get(stem, 0) + 1
+        if stems[stem] > 1:
+            stem = f"{stem}_{stems[stem]}"
+        jobs.append((str(p), stem))
+
+    results: List[Dict] = []
+    if jobs:
+        with cf.ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = [pool.submit(_render_job, script, stem, threads_per_job, retries, profile) for script, stem in jobs]
+            results = [f.result() for f in futures]
+
+    run_id = dt.datetime.utcnow().strftime("%Y-%m-%d")
+    manifest = {
+        "run_id": run_id,
+        "created_at": dt.datetime.utcnow().isoformat() + "Z",
+        "workers": workers,
+        "threads_per_job": threads_per_job,
+        "profile": profile,
+        "done": sum(1 for r in results if r["status"] == "done"),
+        "failed": sum(1 for r in results if r["status"] != "done"),
+        "jobs": results,
+    }
+    OUTPUTS.mkdir(parents=True, exist_ok=True)
+    manifest_path = manifest_path or OUTPUTS / f"batch_{run_id}.json"
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    manifest["manifest_path"] = str(manifest_path)
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Render nhiều script thành video trong 1 lần chạy")
+    parser.add_argument("scripts", nargs="*", type=Path, help="mặc định: outputs/script_<hôm nay>_*.txt (top-k của pipeline)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=THREADS_PER_JOB, help="ffmpeg threads mỗi job")
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--profile", default=None, help="encode profile trong config/style.json")
+    args = parser.parse_args()
+
+    scripts = args.scripts
+    if not scripts:
+        today = dt.datetime.utcnow().strftime("%Y-%m-%d")
+        scripts = sorted(OUTPUTS.glob(f"script_{today}_*.txt"))
+    manifest = render_batch(scripts, workers=args.workers, threads_per_job=args.threads, retries=args.retries, profile=args.profile)
+    print(manifest["manifest_path"])
+    if manifest["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
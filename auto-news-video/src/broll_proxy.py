@@ -0,0 +1,95 @@
+import concurrent.futures as cf
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from ffmpeg_caps import probe
+from file_cache import FileCache, file_digests
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "data"
+BROLL_DIR = ROOT / "assets" / "broll"
+PROXY_DIR = DATA / "broll_proxy"
+PROXY_MAX_BYTES = 4 * 1024 * 1024 * 1024
+SOURCE_HASHES = PROXY_DIR / "sources.json"
+
+PROXY_MAX_WORKERS = 2
+
+# đổi filter/encode của proxy thì tăng version để key cũ tự hết hiệu lực
+PROXY_VERSION = 1
+PROXY_FPS = 30
+PROXY_FILTER = (
+    "scale=1080:1920:force_original_aspect_ratio=increase,"
+    "crop=1080:1920,eq=saturation=1.08:contrast=1.06:brightness=0.01,"
+    f"fps={PROXY_FPS},format=yuv420p"
+)
+PROXY_ENCODE = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "16", "-g", str(PROXY_FPS), "-keyint_min", str(PROXY_FPS), "-sc_threshold", "0"]
+
+_cache = FileCache(PROXY_DIR, max_bytes=PROXY_MAX_BYTES, suffix=".mp4")
+
+
+def source_hashes(paths: List[Path]) -> Dict[Path, str]:
+    return file_digests(paths, SOURCE_HASHES)
+
+
+def proxy_key(source_sha256: str) -> str:
+    raw = json.dumps({"src": source_sha256, "v": PROXY_VERSION, "vf": PROXY_FILTER, "enc": PROXY_ENCODE}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _transcode(ffmpeg: str, src: Path, key: str) -> Path:
+    out = PROXY_DIR / f".{key}.{os.getpid()}.mp4"
+    try:
+        subprocess.run(
+            [ffmpeg, "-y", "-v", "error", "-i", str(src), "-an", "-vf", PROXY_FILTER, *PROXY_ENCODE, "-movflags", "+faststart", str(out)],
+            check=True,
+        )
+        return _cache.put(key, out, {"source": src.name}, move=True)
+    finally:
+        out.unlink(missing_ok=True)
+
+
+def ensure_proxies(paths: List[Path], max_workers: int = PROXY_MAX_WORKERS) -> List[Tuple[Path, bool]]:
+    # trả về (file dùng để render, đã normalize chưa); clip transcode lỗi thì giữ file gốc
+    ffmpeg = probe()["ffmpeg"]
+    if not ffmpeg or not paths:
+        return [(p, False) for p in paths]
+
+    keys = {p: proxy_key(h) for p, h in source_hashes(paths).items()}
+    proxies: Dict[str, Path] = {}
+    # clip trùng nội dung (copy/đổi tên) dùng chung 1 proxy, chỉ transcode 1 lần
+    missing: Dict[str, Path] = {}
+    for p in paths:
+        key = keys[p]
+        if key in proxies or key in missing:
+            continue
+        hit = _cache.get(key)
+        if hit is not None:
+            proxies[key] = hit["path"]
+        else:
+            missing[key] = p
+
+    if missing:
+        PROXY_DIR.mkdir(parents=True, exist_ok=True)
+        with cf.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as pool:
+            futures = {pool.submit(_transcode, ffmpeg, p, key): key for key, p in missing.items()}
+            for fut in cf.as_completed(futures):
+                try:
+                    proxies[futures[fut]] = fut.result()
+                except Exception:
+                    pass
+    return [(proxies[keys[p]], True) if keys[p] in proxies else (p, False) for p in paths]
+
+
+def main() -> None:
+    # build sẵn proxy cho cả thư viện b-roll (vd chạy sau khi thêm clip mới)
+    clips = sorted(p for p in BROLL_DIR.glob("*.mp4") if p.is_file()) if BROLL_DIR.exists() else []
+    for src, (path, ok) in zip(clips, ensure_proxies(clips)):
+        print(f"{'ok ' if ok else 'ERR'} {src.name} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,130 @@
+import atexit
 import json
+import os
+import sqlite3
+import threading
 from pathlib import Path
 from datetime import datetime, timezone
+from typing import Dict, List
 
 ROOT = Path(__file__).resolve().parents[1]
 EVENTS = ROOT / "data" / "events.jsonl"
 
+# progress bắn nhiều event/giây lúc render -> gom buffer, ghi theo lô
+EVENTS_FLUSH_BYTES = 64 * 1024
+EVENTS_FLUSH_INTERVAL_SEC = 1.0
+# chỉ status này được nằm chờ trong buffer; done/error/... ghi ngay để process khác thấy liền
+BUFFERED_STATUSES = {"progress"}
+# never: để OS tự ghi xuống đĩa; flush: fsync sau mỗi lần flush; always: mỗi event flush + fsync luôn
+EVENTS_FSYNC = "never"
+# index phụ cho events.jsonl (jsonl vẫn là log gốc); đồng bộ tăng dần từ offset đã đọc lần trước
+EVENTS_INDEX = ROOT / "data" / "events.idx.db"
 
-def emit(run_id: str, agent: str, status: str, artifact: str | None = None, detail: str | None = None):
-    EVENTS.parent.mkdir(parents=True, exist_ok=True)
+
+class EventWriter:
+    # giữ fd append mở suốt process, gom event vào buffer và ghi theo kích thước/thời gian
+    def __init__(self, flush_bytes: int = EVENTS_FLUSH_BYTES, flush_interval: float = EVENTS_FLUSH_INTERVAL_SEC, fsync: str = EVENTS_FSYNC):
+        if fsync not in ("never", "flush", "always"):
+            raise ValueError(f"unknown fsync policy: {fsync}")
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._reset()
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()
+        self._buf: List[bytes] = []
+        self._size = 0
+        self._fd: int | None = None
+        self._path: Path | None = None
+        self._timer: threading.Thread | None = None
+        self._wake = threading.Event()
+
+    def _after_fork(self) -> None:
+        fd = self._fd
+        self._reset()
+        if fd is not None:
+            os.close(fd)
+
+    def _open(self) -> int:
+        # mở lại nếu EVENTS bị đổi path hoặc file bị xoá/thay (rotate) kể từ lần mở trước
+        if self._fd is not None and self._path == EVENTS:
+            try:
+                if os.stat(EVENTS).st_ino == os.fstat(self._fd).st_ino:
+                    return self._fd
+            except FileNotFoundError:
+                pass
+        self._close_fd()
+        EVENTS.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(EVENTS, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._path = EVENTS
+        return self._fd
+
+    def _close_fd(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
+
+    def _ensure_timer(self) -> None:
+        if self._timer is not None and self._timer.is_alive():
+            return
+        self._timer = threading.Thread(target=self._tick, name="event-bus-flush", daemon=True)
+        self._timer.start()
+
+    def _tick(self) -> None:
+        while not self._wake.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def write(self, record: Dict) -> None:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._buf.append(line)
+            self._size += len(line)
+            if (
+                self.fsync == "always"
+                or record.get("status") not in BUFFERED_STATUSES
+                or self._size >= self.flush_bytes
+            ):
+                self._flush_locked()
+            else:
+                self._ensure_timer()
+
+    def _flush_locked(self) -> None:
+        if not self._buf:
+            return
+        data = memoryview(b"".join(self._buf))
+        fd = self._open()
+        # 1 lần write với O_APPEND -> các process cùng ghi không chen dòng vào nhau
+        while data:
+            n = os.write(fd, data)
+            data = data[n:]
+        self._buf.clear()
+        self._size = 0
+        if self.fsync != "never":
+            os.fsync(fd)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        self._wake.set()
+        with self._lock:
+            try:
+                self._flush_locked()
+            finally:
+                self._close_fd()
+
+
+_writer = EventWriter()
+# process con (fork, vd worker của batch_render) không dùng lại buffer/fd/lock/thread của cha
+os.register_at_fork(after_in_child=_writer._after_fork)
+
+
+def emit(run_id: str, agent: str, status: str, artifact: str | None = None, detail: str | None = None, data: Dict | None = None):
     payload = {
         "ts": datetime.now(timezone.utc).isoformat(),
         "run_id": run_id,
@@ -18,19 +135,140 @@ def emit(run_id: str, agent: str, status: str, artifact: str | None = None, deta
         payload["artifact"] = artifact
     if detail:
         payload["detail"] = detail
-    with EVENTS.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    if data:
+        payload["data"] = data
+    _writer.write(payload)
 
 
-def has_done(run_id: str, agent: str) -> bool:
+def flush() -> None:
+    _writer.flush()
+
+
+@atexit.register
+def _close_writer() -> None:
+    # thoát bình thường hay do exception chưa bắt đều chạy atexit -> không mất progress còn trong buffer
+    _writer.close()
+
+
+def _connect_index() -> sqlite3.Connection:
+    EVENTS_INDEX.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(EVENTS_INDEX, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS event_keys (
+            run_id TEXT,
+            agent TEXT,
+            status TEXT,
+            first_offset INTEGER,
+            last_offset INTEGER,
+            PRIMARY KEY (run_id, agent, status)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def _sync_index(conn: sqlite3.Connection) -> None:
+    # đọc phần jsonl mới từ offset cũ; lần đầu (offset 0) chính là migrate toàn bộ file sẵn có
     if not EVENTS.exists():
-        return False
-    with EVENTS.open("r", encoding="utf-8") as f:
+        return
+    st = EVENTS.stat()
+    meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    offset = int(meta.get("offset", 0))
+    if meta.get("inode") != str(st.st_ino) or st.st_size < offset:
+        # file bị thay/cắt ngắn -> index lại từ đầu
+        with conn:
+            conn.execute("DELETE FROM event_keys")
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('inode', ?)", (str(st.st_ino),))
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('offset', '0')")
+        offset = 0
+    if st.st_size == offset:
+        return
+
+    rows = []
+    pos = offset
+    with EVENTS.open("rb") as f:
+        f.seek(offset)
         for line in f:
+            if not line.endswith(b"\n"):
+                # dòng đang ghi dở, để lần sync sau
+                break
+            try:
+                x = json.loads(line)
+                rows.append((x.get("run_id"), x.get("agent"), x.get("status"), pos, pos))
+            except Exception:
+                pass
+            pos += len(line)
+
+    # upsert idempotent: 2 process sync trùng đoạn vẫn ra cùng kết quả
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO event_keys(run_id, agent, status, first_offset, last_offset) VALUES (?,?,?,?,?)
+            ON CONFLICT(run_id, agent, status) DO UPDATE SET
+                first_offset = MIN(first_offset, excluded.first_offset),
+                last_offset = MAX(last_offset, excluded.last_offset)
+            """,
+            rows,
+        )
+        conn.execute(
+            "INSERT INTO meta(key, value) VALUES ('offset', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+            (str(pos),),
+        )
+
+
+def has_status(run_id: str, agent: str, status: str) -> bool:
+    flush()
+    if not EVENTS.exists():
+        return False
+    conn = _connect_index()
+    try:
+        _sync_index(conn)
+        row = conn.execute(
+            "SELECT 1 FROM event_keys WHERE run_id=? AND agent=? AND status=?",
+            (run_id, agent, status),
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def has_done(run_id: str, agent: str) -> bool:
+    return has_status(run_id, agent, "done")
+
+
+def read_events(run_id: str, agent: str, status: str) -> list:
+    # đọc lại event gốc trong jsonl từ offset đã index (first..last), không quét cả file
+    flush()
+    if not EVENTS.exists():
+        return []
+    conn = _connect_index()
+    try:
+        _sync_index(conn)
+        row = conn.execute(
+            "SELECT first_offset, last_offset FROM event_keys WHERE run_id=? AND agent=? AND status=?",
+            (run_id, agent, status),
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return []
+
+    out = []
+    with EVENTS.open("rb") as f:
+        f.seek(row[0])
+        while f.tell() <= row[1]:
+            line = f.readline()
+            if not line:
+                break
             try:
                 x = json.loads(line)
             except Exception:
                 continue
-            if x.get("run_id") == run_id and x.get("agent") == agent and x.get("status") == "done":
-                return True
-    return False
+            if x.get("run_id") == run_id and x.get("agent") == agent and x.get("status") == status:
+                out.append(x)
+    return out
@@ -0,0 +1,154 @@
+import concurrent.futures as cf
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, List
+
+import feedparser
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "data"
+FEED_CACHE_DB = DATA / "feed_cache.db"
+
+FEED_TIMEOUT_SEC = 10.0
+FEED_DEADLINE_SEC = 20.0
+MAX_WORKERS = 16
+USER_AGENT = "Mozilla/5.0 (compatible; auto-news-video/1.0)"
+
+
+def _init_cache(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS feed_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            feed_json TEXT,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def _load_cache(urls: List[str]) -> Dict[str, Dict]:
+    if not urls:
+        return {}
+    DATA.mkdir(parents=True, exist_ok=True)
+    out: Dict[str, Dict] = {}
+    with sqlite3.connect(FEED_CACHE_DB) as conn:
+        _init_cache(conn)
+        marks = ",".join("?" for _ in urls)
+        rows = conn.execute(
+            f"SELECT url, etag, last_modified, feed_json FROM feed_cache WHERE url IN ({marks})",
+            urls,
+        ).fetchall()
+    for url, etag, last_modified, feed_json in rows:
+        try:
+            feed = json.loads(feed_json)
+        except Exception:
+            continue
+        out[url] = {"etag": etag, "last_modified": last_modified, "feed": feed}
+    return out
+
+
+def _store_cache(rows: List[Dict]) -> None:
+    if not rows:
+        return
+    with sqlite3.connect(FEED_CACHE_DB) as conn:
+        _init_cache(conn)
+        conn.executemany(
+            """
+            INSERT INTO feed_cache(url, etag, last_modified, feed_json, updated_at)
+            VALUES (?,?,?,?,CURRENT_TIMESTAMP)
+            ON CONFLICT(url) DO UPDATE SET
+                etag=excluded.etag,
+                last_modified=excluded.last_modified,
+                feed_json=excluded.feed_json,
+                updated_at=excluded.updated_at
+            """,
+            [(r["url"], r["etag"], r["last_modified"], json.dumps(r["feed"], ensure_ascii=False)) for r in rows],
+        )
+        conn.commit()
+
+
+def _fetch_one(url: str, timeout: float, validators: Dict | None) -> Dict:
+    headers = {"User-Agent": USER_AGENT}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    resp = requests.get(url, timeout=timeout, headers=headers)
+    resp.raise_for_status()
+    return {
+        "status": resp.status_code,
+        "body": resp.content if resp.status_code != 304 else b"",
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    }
+
+
+def fetch_all(
+    urls: List[str],
+    timeout: float = FEED_TIMEOUT_SEC,
+    deadline: float = FEED_DEADLINE_SEC,
+    validators: Dict[str, Dict] | None = None,
+) -> Dict[str, Dict]:
+    # tải song song; feed nào lỗi hoặc quá deadline thì bỏ qua, trả về phần đã có
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return {}
+    validators = validators or {}
+
+    out: Dict[str, Dict] = {}
+    pool = cf.ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(urls)))
+    futures = {pool.submit(_fetch_one, url, timeout, validators.get(url)): url for url in urls}
+    try:
+        for fut in cf.as_completed(futures, timeout=deadline):
+            try:
+                out[futures[fut]] = fut.result()
+            except Exception:
+                continue
+    except cf.TimeoutError:
+        pass
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return out
+
+
+def _normalize(parsed: feedparser.FeedParserDict, url: str) -> Dict:
+    entries = []
+    for entry in parsed.entries:
+        entries.append(
+            {
+                "title": entry.get("title", "").strip(),
+                "link": entry.get("link", "").strip(),
+                "published": entry.get("published", ""),
+            }
+        )
+    return {"title": parsed.feed.get("title", url), "entries": entries}
+
+
+def load_feeds(urls: List[str], timeout: float = FEED_TIMEOUT_SEC, deadline: float = FEED_DEADLINE_SEC) -> Dict[str, Dict]:
+    urls = list(dict.fromkeys(u for u in urls if u))
+    cache = _load_cache(urls)
+    responses = fetch_all(urls, timeout=timeout, deadline=deadline, validators=cache)
+
+    feeds: Dict[str, Dict] = {}
+    updates: List[Dict] = []
+    for url in urls:
+        resp = responses.get(url)
+        if resp is None:
+            continue
+        if resp["status"] == 304:
+            # không đổi từ lần poll trước -> dùng lại entries đã parse, không parse lại
+            if url in cache:
+                feeds[url] = cache[url]["feed"]
+            continue
+        feed = _normalize(feedparser.parse(resp["body"]), url)
+        feeds[url] = feed
+        if resp["etag"] or resp["last_modified"]:
+            updates.append({"url": url, "etag": resp["etag"], "last_modified": resp["last_modified"], "feed": feed})
+    _store_cache(updates)
+    return feeds
@@ -0,0 +1,92 @@
+import functools
+import json
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "data"
+CAPS_FILE = DATA / "ffmpeg_caps.json"
+
+
+def _run(ffmpeg_bin: str, flag: str) -> str:
+    try:
+        out = subprocess.run([ffmpeg_bin, "-hide_banner", flag], capture_output=True, text=True, check=False)
+        return (out.stdout or "") + "\n" + (out.stderr or "")
+    except Exception:
+        return ""
+
+
+def _parse_filters(text: str) -> List[str]:
+    # " T.C drawbox           V->V       Draw a colored box"
+    return sorted({m.group(1) for m in re.finditer(r"^\s*[TSC.]{2,3}\s+(\w+)\s+\S*->\S*", text, flags=re.MULTILINE)})
+
+
+def _parse_encoders(text: str) -> List[str]:
+    # " V....D libx264   libx264 H.264 ..."; bỏ phần legend phía trên dòng "------"
+    body = text.split("------", 1)[-1]
+    return sorted({m.group(1) for m in re.finditer(r"^\s*[VAS][FXBD.]{5}\s+(\S+)", body, flags=re.MULTILINE)})
+
+
+def _parse_hwaccels(text: str) -> List[str]:
+    body = text.split("Hardware acceleration methods:", 1)[-1]
+    return [x.strip() for x in body.splitlines() if x.strip()]
+
+
+def _resolve_ffprobe(ffmpeg_bin: str) -> str | None:
+    sibling = Path(ffmpeg_bin).with_name("ffprobe" + Path(ffmpeg_bin).suffix)
+    if sibling.exists():
+        return str(sibling)
+    return shutil.which("ffprobe")
+
+
+def _load_persisted() -> Dict:
+    if not CAPS_FILE.exists():
+        return {}
+    try:
+        data = json.loads(CAPS_FILE.read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _save_persisted(data: Dict) -> None:
+    DATA.mkdir(parents=True, exist_ok=True)
+    tmp = CAPS_FILE.with_name(f"{CAPS_FILE.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, CAPS_FILE)
+
+
+@functools.lru_cache(maxsize=None)
+def probe(ffmpeg_bin: str | None = None) -> Dict:
+    # chạy `ffmpeg -filters/-encoders/-hwaccels` 1 lần cho mỗi binary (path + mtime), lưu ra data/
+    ffmpeg = ffmpeg_bin or shutil.which("ffmpeg")
+    if not ffmpeg:
+        return {"ffmpeg": None, "ffprobe": shutil.which("ffprobe"), "filters": [], "encoders": [], "hwaccels": []}
+
+    resolved = os.path.realpath(ffmpeg)
+    key = f"{resolved}:{os.stat(resolved).st_mtime_ns}"
+    persisted = _load_persisted()
+    caps = persisted.get(key)
+    if caps is None:
+        caps = {
+            "filters": _parse_filters(_run(ffmpeg, "-filters")),
+            "encoders": _parse_encoders(_run(ffmpeg, "-encoders")),
+            "hwaccels": _parse_hwaccels(_run(ffmpeg, "-hwaccels")),
+        }
+        # chỉ giữ entry của các binary còn tồn tại
+        persisted = {k: v for k, v in persisted.items() if os.path.exists(k.rsplit(":", 1)[0])}
+        persisted[key] = caps
+        _save_persisted(persisted)
+    return {**caps, "ffmpeg": ffmpeg, "ffprobe": _resolve_ffprobe(ffmpeg)}
+
+
+def has_filter(caps: Dict, name: str) -> bool:
+    return name in caps.get("filters", [])
+
+
+def has_encoder(caps: Dict, name: str) -> bool:
+    return name in caps.get("encoders", [])
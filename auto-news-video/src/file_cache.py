@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_digests(paths: List[Path], memo_file: Path) -> Dict[Path, str]:
+    # sha256 nội dung file; nhớ theo path + size + mtime trong memo_file để không đọc lại file lớn mỗi lần
+    known: Dict = {}
+    if memo_file.exists():
+        try:
+            data = json.loads(memo_file.read_text(encoding="utf-8"))
+            known = data if isinstance(data, dict) else {}
+        except Exception:
+            known = {}
+
+    out: Dict[Path, str] = {}
+    changed = False
+    for p in paths:
+        st = p.stat()
+        stamp = f"{st.st_size}:{st.st_mtime_ns}"
+        entry = known.get(str(p.resolve()))
+        if not isinstance(entry, dict) or entry.get("stamp") != stamp:
+            entry = {"stamp": stamp, "sha256": _sha256(p)}
+            known[str(p.resolve())] = entry
+            changed = True
+        out[p] = entry["sha256"]
+
+    if changed:
+        memo_file.parent.mkdir(parents=True, exist_ok=True)
+        keep = {k: v for k, v in known.items() if os.path.exists(k)}
+        tmp = memo_file.with_name(f"{memo_file.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(keep, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, memo_file)
+    return out
+
+
+class FileCache:
+    # cache file theo key (content hash); index nằm trong sqlite để nhiều process render dùng chung
+    def __init__(self, root: Path, max_bytes: int = 0, max_age_days: float = 0, suffix: str = ""):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.suffix = suffix
+
+    def _connect(self) -> sqlite3.Connection:
+        self.root.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.root / "index.db", timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                file TEXT,
+                size INTEGER,
+                meta TEXT,
+                created_at REAL,
+                last_used REAL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used)")
+        return conn
+
+    def path_for(self, key: str) -> Path:
+        return self.root / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Dict | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT file, meta FROM entries WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            path = self.root / row[0]
+            if not path.exists():
+                conn.execute("DELETE FROM entries WHERE key=?", (key,))
+                return None
+            conn.execute("UPDATE entries SET last_used=? WHERE key=?", (time.time(), key))
+        return {**json.loads(row[1] or "{}"), "path": path}
+
+    def put(self, key: str, src: Path, meta: Dict | None = None, move: bool = False) -> Path:
+        dst = self.path_for(key)
+        self.root.mkdir(parents=True, exist_ok=True)
+        if src.resolve() != dst.resolve():
+            # tên tạm riêng cho mỗi lần put: các thread cùng process put trùng key không giẫm file của nhau
+            fd, tmp_name = tempfile.mkstemp(prefix=f".{dst.name}.", suffix=".tmp", dir=self.root)
+            os.close(fd)
+            tmp = Path(tmp_name)
+            try:
+                if move:
+                    shutil.move(str(src), str(tmp))
+                else:
+                    shutil.copyfile(src, tmp)
+                os.replace(tmp, dst)
+            finally:
+                tmp.unlink(missing_ok=True)
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries(key, file, size, meta, created_at, last_used) VALUES (?,?,?,?,?,?)",
+                (key, dst.name, dst.stat().st_size, json.dumps(meta or {}, ensure_ascii=False), now, now),
+            )
+        self.evict()
+        return dst
+
+    def evict(self) -> int:
+        cutoff = time.time() - self.max_age_days * 86400 if self.max_age_days > 0 else None
+        removed = []
+        with self._connect() as conn:
+            rows = conn.execute("SELECT key, file, size, last_used FROM entries ORDER BY last_used ASC").fetchall()
+            total = sum(r[2] for r in rows)
+            for key, file, size, last_used in rows:
+                too_old = cutoff is not None and last_used < cutoff
+                # LRU: bỏ entry ít dùng nhất tới khi tổng size về dưới ngưỡng
+                too_big = self.max_bytes > 0 and total > self.max_bytes
+                if not too_old and not too_big:
+                    break
+                removed.append((key, file))
+                total -= size
+            conn.executemany("DELETE FROM entries WHERE key=?", [(k,) for k, _ in removed])
+
+        for _, file in removed:
+            try:
+                (self.root / file).unlink()
+            except FileNotFoundError:
+                pass
+        return len(removed)
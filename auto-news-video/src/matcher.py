@@ -0,0 +1,59 @@
+from collections import deque
+from typing import Dict, List, Tuple
+
+
+class Matcher:
+    # Aho–Corasick trên pattern đã lowercase: 1 lượt quét title trả về mọi hit,
+    # cùng ngữ nghĩa với `pattern.lower() in text.lower()` cho từng pattern
+    def __init__(self, groups: Dict[str, List[str]]):
+        self._groups = list(groups)
+        self._labels: List[Tuple[str, str]] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for group, patterns in groups.items():
+            for pattern in patterns:
+                idx = len(self._labels)
+                self._labels.append((group, pattern))
+                key = pattern.lower()
+                if not key:
+                    continue
+                node = 0
+                for ch in key:
+                    nxt = self._goto[node].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._out.append([])
+                        self._goto[node][ch] = nxt
+                    node = nxt
+                self._out[node].append(idx)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> Dict[str, List[str]]:
+        hits = set()
+        node = 0
+        for ch in text.lower():
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            if self._out[node]:
+                hits.update(self._out[node])
+
+        out: Dict[str, List[str]] = {g: [] for g in self._groups}
+        for idx in sorted(hits):
+            group, pattern = self._labels[idx]
+            out[group].append(pattern)
+        return out
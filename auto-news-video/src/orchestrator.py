@@ -1,10 +1,11 @@
 import datetime as dt
 import json
+import threading
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List
 
 from event_bus import emit
-from pipeline import run as run_pipeline
+from pipeline import run as run_pipeline, todays_script
 from render_video import render_from_script
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -12,6 +13,12 @@ DATA = ROOT / "data"
 OUTPUTS = ROOT / "outputs"
 TASKS_FILE = DATA / "tasks.json"
 
+# tasks.json được ghi từ cả main thread lẫn thread render master
+_tasks_lock = threading.Lock()
+_master_threads: List[threading.Thread] = []
+# run_id -> lỗi của master render nền, để run_daily trả exit code != 0 như lúc render chạy đồng bộ
+_master_errors: Dict[str, str] = {}
+
 
 def _load_tasks() -> Dict:
     if TASKS_FILE.exists():
@@ -25,6 +32,11 @@ def _save_tasks(obj: Dict) -> None:
 
 
 def _set_state(run_id: str, state: str, note: str) -> None:
+    with _tasks_lock:
+        _set_state_locked(run_id, state, note)
+
+
+def _set_state_locked(run_id: str, state: str, note: str) -> None:
     db = _load_tasks()
     tasks = db.setdefault("tasks", [])
     current = next((t for t in tasks if t.get("run_id") == run_id), None)
@@ -41,7 +53,28 @@ def _set_state(run_id: str, state: str, note: str) -> None:
     _save_tasks(db)
 
 
-def run_orchestrated() -> Path:
+def _render_master(run_id: str, script_path: Path, profile: str | None) -> None:
+    try:
+        video_path = render_from_script(script_path, profile=profile, run_id=run_id)
+    except Exception as e:
+        _master_errors[run_id] = str(e)
+        emit(run_id, "agent-producer", "error", detail=f"master render failed: {e}")
+        _set_state(run_id, "Failed", f"Master render failed: {e}")
+        emit(run_id, "orchestrator", "state", detail="Failed")
+        return
+    emit(run_id, "agent-producer", "done", artifact=str(video_path), detail=f"master render done profile={profile or 'default'}")
+    _set_state(run_id, "Done", "Master video ready for publish")
+    emit(run_id, "orchestrator", "state", detail="Done")
+
+
+def wait_master_renders(timeout: float | None = None) -> Dict[str, str]:
+    # chờ các master render nền, trả về {run_id: lỗi} của những bản fail
+    for t in list(_master_threads):
+        t.join(timeout)
+    return dict(_master_errors)
+
+
+def run_orchestrated(profile: str | None = None, preview_profile: str | None = None, fresh: bool = False) -> Path:
     run_id = dt.datetime.utcnow().strftime("%Y-%m-%d")
 
     _set_state(run_id, "Inbox", "Daily run created")
@@ -53,11 +86,29 @@ def run_orchestrated() -> Path:
     _set_state(run_id, "In Progress", "Running pipeline with trend enrich + script build")
     emit(run_id, "orchestrator", "state", detail="In Progress")
 
-    script_path = run_pipeline()
-    emit(run_id, "agent-builder", "done", artifact=str(script_path), detail="collector+editor done")
+    # retry/rerun trong ngày dùng lại script đã có để render cache hit; fresh=True thì build lại từ tin mới
+    script_path = None if fresh else todays_script()
+    if script_path is not None:
+        emit(run_id, "agent-builder", "done", artifact=str(script_path), detail="reused today's script from checkpoint")
+    else:
+        script_path = run_pipeline()
+        emit(run_id, "agent-builder", "done", artifact=str(script_path), detail="collector+editor done")
+
+    if preview_profile:
+        # 2 pha: preview nhẹ để người review xem ngay, bản master encode nền song song với lúc review
+        preview_path = render_from_script(script_path, out_stem=f"{run_id}_preview", profile=preview_profile, run_id=run_id)
+        emit(run_id, "agent-producer", "preview", artifact=str(preview_path), detail=f"preview done profile={preview_profile}")
+
+        _set_state(run_id, "Review", "Preview ready, master encoding in background")
+        emit(run_id, "orchestrator", "state", detail="Review")
+
+        master = threading.Thread(target=_render_master, args=(run_id, script_path, profile), name=f"master-render-{run_id}")
+        master.start()
+        _master_threads.append(master)
+        return preview_path
 
-    video_path = render_from_script(script_path)
-    emit(run_id, "agent-producer", "done", artifact=str(video_path), detail="render done")
+    video_path = render_from_script(script_path, profile=profile, run_id=run_id)
+    emit(run_id, "agent-producer", "done", artifact=str(video_path), detail=f"render done profile={profile or 'default'}")
 
     _set_state(run_id, "Review", "Await manual preview before publish")
     emit(run_id, "orchestrator", "state", detail="Review")
@@ -1,12 +1,19 @@
+import concurrent.futures as cf
+import hashlib
+import heapq
 import json
 import random
+import re
 import sqlite3
 import datetime as dt
-import subprocess
+import unicodedata
 from pathlib import Path
-from typing import List, Dict
+from typing import Any, Callable, List, Dict, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-import feedparser
+from feeds import load_feeds
+from scoring import load_scoring_config, score_batch
+from trend_worker import fetch_trends as fetch_playwright_trends
 
 ROOT = Path(__file__).resolve().parents[1]
 DATA = ROOT / "data"
@@ -25,12 +32,49 @@ TREND_SOURCES = [
 ]
 STYLE_FILE = ROOT / "config" / "style.json"
 PLAYWRIGHT_ENRICH_SCRIPT = ROOT / "scripts" / "playwright_trend_enrich.mjs"
+PLAYWRIGHT_TIMEOUT_SEC = 60.0
+# socket của daemon Playwright warm, dùng chung giữa các lần chạy pipeline
+PLAYWRIGHT_SOCKET = DATA / "trend_worker.sock"
+SQLITE_MAX_VARS = 500
+
+TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "mc_cid", "mc_eid", "ocid", "oc", "cmpid", "ref", "_ga"}
+HOST_VARIANT_PREFIXES = ("www.", "m.", "mobile.", "amp.")
+# chỉ Google News gắn " - Tên báo" vào cuối title; đổi cách tính title_hash thì tăng version để hash lại bảng seen
+GOOGLE_NEWS_HOST = "news.google.com"
+TITLE_HASH_VERSION = 2
+
+
+def _load_storage_config() -> Dict:
+    defaults = {
+        "seen_retention_days": 90,
+        "vacuum_interval_days": 7,
+        "cache_size_kib": 16384,
+    }
+    if not STYLE_FILE.exists():
+        return defaults
+    try:
+        data = json.loads(STYLE_FILE.read_text(encoding="utf-8"))
+        custom = data.get("storage", {})
+        if isinstance(custom, dict):
+            defaults.update({k: int(v) for k, v in custom.items() if k in defaults})
+    except Exception:
+        pass
+    return defaults
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{_load_storage_config()['cache_size_kib']}")
+    return conn
 
 
 def init_storage() -> None:
     DATA.mkdir(parents=True, exist_ok=True)
     OUTPUTS.mkdir(parents=True, exist_ok=True)
-    with sqlite3.connect(DB) as conn:
+    with _connect() as conn:
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS seen (
@@ -42,9 +86,63 @@ def init_storage() -> None:
             )
             """
         )
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(seen)")}
+        if "norm_link" not in cols:
+            conn.execute("ALTER TABLE seen ADD COLUMN norm_link TEXT")
+        if "title_hash" not in cols:
+            conn.execute("ALTER TABLE seen ADD COLUMN title_hash INTEGER")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_norm_link ON seen(norm_link)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_title_hash ON seen(title_hash)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_created_at ON seen(created_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        # backfill 1 lần cho các dòng cũ trước khi có cột mới, hoặc cho cả bảng khi cách tính title_hash đổi
+        row = conn.execute("SELECT value FROM meta WHERE key='title_hash_version'").fetchone()
+        if row is None or row[0] != str(TITLE_HASH_VERSION):
+            legacy = conn.execute("SELECT id, link, title FROM seen").fetchall()
+        else:
+            legacy = conn.execute("SELECT id, link, title FROM seen WHERE norm_link IS NULL").fetchall()
+        if legacy:
+            conn.executemany(
+                "UPDATE seen SET norm_link=?, title_hash=? WHERE id=?",
+                [(canonical_link(link or ""), title_fingerprint(title or "", link or ""), row_id) for row_id, link, title in legacy],
+            )
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('title_hash_version', ?)", (str(TITLE_HASH_VERSION),))
         conn.commit()
 
 
+def maintain_storage() -> Dict:
+    cfg = _load_storage_config()
+    conn = _connect()
+    try:
+        pruned = 0
+        if cfg["seen_retention_days"] > 0:
+            cur = conn.execute(
+                "DELETE FROM seen WHERE created_at < datetime('now', ?)",
+                (f"-{cfg['seen_retention_days']} days",),
+            )
+            pruned = cur.rowcount
+
+        row = conn.execute("SELECT value FROM meta WHERE key='last_vacuum'").fetchone()
+        last_vacuum = dt.datetime.fromisoformat(row[0]) if row else None
+        now = dt.datetime.utcnow()
+        vacuum_due = last_vacuum is None or now - last_vacuum >= dt.timedelta(days=cfg["vacuum_interval_days"])
+        if vacuum_due:
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('last_vacuum', ?)", (now.isoformat(),))
+        conn.commit()
+
+        if vacuum_due:
+            # VACUUM không chạy được trong transaction, ANALYZE lại stats cho planner
+            conn.execute("VACUUM")
+            conn.execute("ANALYZE")
+        else:
+            conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"pruned": pruned, "vacuumed": vacuum_due}
+    finally:
+        conn.close()
+
+
 def load_checkpoint() -> Dict:
     if CHECKPOINT.exists():
         return json.loads(CHECKPOINT.read_text(encoding="utf-8"))
@@ -58,19 +156,26 @@ def save_checkpoint(last_step: str, run_date: str, artifacts: Dict) -> None:
     )
 
 
-def collect_news(limit: int = 40) -> List[Dict]:
+def todays_script() -> Path | None:
+    # script đã build xong hôm nay (retry/rerun cùng ngày): chạy lại pipeline sẽ ra script khác
+    # (hook random, tin đã vào `seen` bị dedupe mất) nên render cache không bao giờ hit
+    cp = load_checkpoint()
+    if cp.get("last_step") != "scripted" or cp.get("run_date") != dt.datetime.utcnow().strftime("%Y-%m-%d"):
+        return None
+    path = cp.get("artifacts", {}).get("script_path")
+    return Path(path) if path and Path(path).exists() else None
+
+
+def collect_news(limit: int = 40, feeds: Dict[str, Dict] | None = None) -> List[Dict]:
+    if feeds is None:
+        feeds = load_feeds(RSS_SOURCES)
     items = []
     for url in RSS_SOURCES:
-        feed = feedparser.parse(url)
-        for entry in feed.entries[:limit]:
-            items.append(
-                {
-                    "title": entry.get("title", "").strip(),
-                    "link": entry.get("link", "").strip(),
-                    "published": entry.get("published", ""),
-                    "source": feed.feed.get("title", url),
-                }
-            )
+        feed = feeds.get(url)
+        if feed is None:
+            continue
+        for entry in feed["entries"][:limit]:
+            items.append({**entry, "source": feed["title"]})
     return [i for i in items if i["title"] and i["link"]]
 
 
@@ -86,82 +191,150 @@ def _unique_keep_order(items: List[str]) -> List[str]:
     return out
 
 
-def collect_trends_rss(limit: int = 20) -> List[str]:
+def collect_trends_rss(limit: int = 20, feeds: Dict[str, Dict] | None = None) -> List[str]:
+    if feeds is None:
+        feeds = load_feeds(TREND_SOURCES)
     terms: List[str] = []
     for url in TREND_SOURCES:
-        feed = feedparser.parse(url)
-        for entry in feed.entries[:limit]:
-            title = entry.get("title", "").strip()
+        feed = feeds.get(url)
+        if feed is None:
+            continue
+        for entry in feed["entries"][:limit]:
+            title = entry["title"]
             if title:
                 terms.append(title)
     return _unique_keep_order(terms)
 
 
-def collect_trends_playwright() -> List[str]:
+def collect_trends_playwright(timeout: float = PLAYWRIGHT_TIMEOUT_SEC) -> List[str]:
     if not PLAYWRIGHT_ENRICH_SCRIPT.exists():
         return []
     try:
-        subprocess.run(["node", str(PLAYWRIGHT_ENRICH_SCRIPT)], cwd=str(ROOT), check=False, capture_output=True, text=True)
+        trends = _unique_keep_order(fetch_playwright_trends(PLAYWRIGHT_ENRICH_SCRIPT, ROOT, timeout, sock_path=PLAYWRIGHT_SOCKET))
     except Exception:
         return []
 
     today = dt.datetime.utcnow().strftime("%Y-%m-%d")
     out_file = OUTPUTS / f"playwright_trends_{today}.json"
-    if not out_file.exists():
-        return []
-    try:
-        data = json.loads(out_file.read_text(encoding="utf-8"))
-        trends = data.get("trends", [])
-        if isinstance(trends, list):
-            return _unique_keep_order([str(x) for x in trends])
-    except Exception:
-        return []
-    return []
+    out_file.write_text(json.dumps({"source": "playwright", "trends": trends}, ensure_ascii=False, indent=2), encoding="utf-8")
+    return trends
 
 
-def collect_trends(limit: int = 20) -> List[str]:
-    rss_terms = collect_trends_rss(limit=limit)
-    pw_terms = collect_trends_playwright()
+def _merge_trends(pw_terms: List[str], rss_terms: List[str], limit: int = 20) -> List[str]:
     merged = _unique_keep_order(pw_terms + rss_terms)
     return merged[:max(limit, 30)]
 
 
-def dedupe_new(items: List[Dict]) -> List[Dict]:
-    with sqlite3.connect(DB) as conn:
-        cur = conn.cursor()
-        fresh = []
-        for i in items:
-            cur.execute("SELECT 1 FROM seen WHERE link=?", (i["link"],))
-            if cur.fetchone() is None:
-                fresh.append(i)
-        return fresh
+def collect_trends(limit: int = 20, feeds: Dict[str, Dict] | None = None) -> List[str]:
+    rss_terms = collect_trends_rss(limit=limit, feeds=feeds)
+    pw_terms = collect_trends_playwright()
+    return _merge_trends(pw_terms, rss_terms, limit=limit)
+
+
+def _chunks(values: List, size: int = SQLITE_MAX_VARS) -> List[List]:
+    return [values[i : i + size] for i in range(0, len(values), size)]
+
 
+def canonical_link(url: str) -> str:
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    query = parse_qsl(parts.query, keep_blank_values=True)
+
+    # link Google News (news.google.com/rss/articles/<id>) là id mã hoá, không giải ra bài gốc offline được
+    # -> tin Google News trùng với VnExpress/Tuổi Trẻ chỉ gộp được nhờ title_fingerprint
+    for prefix in HOST_VARIANT_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix) :]
+            break
+
+    path = re.sub(r"/amp/?$", "", parts.path).rstrip("/") or "/"
+    kept = sorted((k, v) for k, v in query if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS)
+    return urlunsplit(("https", host, path, urlencode(kept), ""))
+
+
+def _normalize_title(title: str, strip_publisher: bool = False) -> str:
+    t = unicodedata.normalize("NFC", title).casefold().strip()
+    # bỏ " - Tên báo" của Google News; title báo khác giữ nguyên vế sau
+    # (vd "Giá vàng hôm nay - tăng mạnh" / "- giảm sâu" là 2 tin khác nhau)
+    head, sep, tail = t.rpartition(" - ")
+    if strip_publisher and sep and head and len(tail.split()) <= 4:
+        t = head
+    t = re.sub(r"[^\w\s]", " ", t)
+    return " ".join(t.split())
+
+
+def title_fingerprint(title: str, link: str = "") -> int | None:
+    from_google_news = (urlsplit(link.strip()).hostname or "").lower() == GOOGLE_NEWS_HOST
+    words = _normalize_title(title, strip_publisher=from_google_news).split()
+    if not words:
+        return None
+    features = [" ".join(words[i : i + 2]) for i in range(len(words) - 1)] or words
+
+    # SimHash 64-bit trên shingle 2 từ
+    acc = [0] * 64
+    for f in features:
+        h = int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            acc[bit] += 1 if (h >> bit) & 1 else -1
+    value = sum(1 << bit for bit in range(64) if acc[bit] > 0)
+    # SQLite INTEGER là signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _known_values(conn: sqlite3.Connection, column: str, values: List) -> set:
+    known = set()
+    for chunk in _chunks([v for v in values if v is not None]):
+        marks = ",".join("?" for _ in chunk)
+        rows = conn.execute(f"SELECT {column} FROM seen WHERE {column} IN ({marks})", chunk)
+        known.update(r[0] for r in rows)
+    return known
+
+
+def dedupe_new(items: List[Dict]) -> List[Dict]:
+    # gộp tin trùng ngay trong batch (Google News + VnExpress hay đăng cùng bài)
+    batch = []
+    batch_keys = set()
+    for i in items:
+        keys = {("link", i["link"]), ("norm", canonical_link(i["link"]))}
+        fp = title_fingerprint(i["title"], i["link"])
+        if fp is not None:
+            keys.add(("fp", fp))
+        if keys & batch_keys:
+            continue
+        batch_keys |= keys
+        batch.append((i, keys))
 
-def score_item(item: Dict, keyword_boost: List[str], trends: List[str]) -> int:
-    title = item["title"].lower()
-    score = 1
+    with _connect() as conn:
+        known = {("link", v) for v in _known_values(conn, "link", [i["link"] for i, _ in batch])}
+        known |= {("norm", v) for v in _known_values(conn, "norm_link", [v for _, ks in batch for k, v in ks if k == "norm"])}
+        known |= {("fp", v) for v in _known_values(conn, "title_hash", [v for _, ks in batch for k, v in ks if k == "fp"])}
+    return [i for i, keys in batch if not keys & known]
 
-    for kw in keyword_boost:
-        if kw.lower() in title:
-            score += 3
 
-    trend_hits = [t for t in trends if t.lower() in title]
-    score += min(8, len(trend_hits) * 4)
+def score_item(item: Dict, keyword_boost: List[str], trends: List[str]) -> float:
+    cfg = {**load_scoring_config(), "keyword_boost": keyword_boost}
+    scores, hits = score_batch([item], trends, config=cfg)
+    item["trend_hits"] = hits[0]
+    item["score"] = float(scores[0])
+    return item["score"]
 
-    clickbait = ["sốc", "không thể tin", "gây bão"]
-    if any(x in title for x in clickbait):
-        score -= 2
 
-    score += 1 if item.get("published") else 0
-    item["trend_hits"] = trend_hits
-    item["score"] = score
-    return score
+def score_items(items: List[Dict], trends: List[str], config: Dict | None = None) -> List[Tuple[float, List[str]]]:
+    # (score, trend_hits) theo đúng thứ tự items, không ghi đè vào items
+    scores, hits = score_batch(items, trends, config=config)
+    return list(zip(scores.tolist(), hits))
 
 
-def pick_top(items: List[Dict], trends: List[str], top_k: int = 3) -> List[Dict]:
-    keyword_boost = ["ai", "công nghệ", "startup", "kinh tế", "chính sách", "tiktok", "youtube"]
-    ranked = sorted(items, key=lambda x: score_item(x, keyword_boost, trends), reverse=True)
-    return ranked[:top_k]
+def pick_top(
+    items: List[Dict],
+    trends: List[str],
+    top_k: int = 3,
+    scored: List[Tuple[float, List[str]]] | None = None,
+) -> List[Dict]:
+    if scored is None:
+        scored = score_items(items, trends)
+    best = heapq.nlargest(top_k, range(len(items)), key=lambda i: scored[i][0])
+    return [{**items[i], "score": scored[i][0], "trend_hits": scored[i][1]} for i in best]
 
 
 def _load_hook_templates() -> List[str]:
@@ -258,52 +431,114 @@ def build_script(top_news: List[Dict], trends: List[str]) -> str:
 
 
 def persist_seen(items: List[Dict]) -> None:
-    with sqlite3.connect(DB) as conn:
+    with _connect() as conn:
         conn.executemany(
-            "INSERT OR IGNORE INTO seen(link,title,published_at) VALUES (?,?,?)",
-            [(i["link"], i["title"], i.get("published", "")) for i in items],
+            "INSERT OR IGNORE INTO seen(link,title,published_at,norm_link,title_hash) VALUES (?,?,?,?,?)",
+            [
+                (i["link"], i["title"], i.get("published", ""), canonical_link(i["link"]), title_fingerprint(i["title"], i["link"]))
+                for i in items
+            ],
         )
         conn.commit()
 
 
+def _run_stages(stages: Dict[str, Tuple[Callable[..., Any], List[str]]], on_done: Callable[[str, Any], None]) -> Dict[str, Any]:
+    # DAG nhỏ: stage nào đủ input thì chạy ngay, các stage độc lập chạy song song;
+    # on_done (checkpoint) luôn chạy ở thread gọi
+    results: Dict[str, Any] = {}
+    pending = dict(stages)
+    running: Dict[cf.Future, str] = {}
+    with cf.ThreadPoolExecutor(max_workers=max(1, len(stages))) as pool:
+        while pending or running:
+            for name, (fn, deps) in list(pending.items()):
+                if all(d in results for d in deps):
+                    running[pool.submit(fn, *[results[d] for d in deps])] = name
+                    del pending[name]
+            if not running:
+                raise ValueError(f"Unresolvable stage dependencies: {sorted(pending)}")
+            done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                results[name] = fut.result()
+                on_done(name, results[name])
+    return results
+
+
 def run() -> Path:
     init_storage()
     today = dt.datetime.utcnow().strftime("%Y-%m-%d")
     cp = load_checkpoint()
     artifacts = cp.get("artifacts", {}) if cp.get("run_date") == today else {}
-
-    trends = collect_trends()
     trend_file = OUTPUTS / f"trends_{today}.json"
-    trend_file.write_text(json.dumps(trends, ensure_ascii=False, indent=2), encoding="utf-8")
-    save_checkpoint("trends", today, {**artifacts, "trend_count": len(trends), "trend_path": str(trend_file)})
-
-    news = collect_news()
-    save_checkpoint("collected", today, {**artifacts, "collected_count": len(news), "trend_count": len(trends), "trend_path": str(trend_file)})
-
-    fresh = dedupe_new(news)
-    save_checkpoint("deduped", today, {**artifacts, "fresh_count": len(fresh), "trend_count": len(trends), "trend_path": str(trend_file)})
 
-    top = pick_top(fresh, trends=trends, top_k=3)
+    def on_done(stage: str, result: Any) -> None:
+        if stage == "trends":
+            trend_file.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+            artifacts.update({"trend_count": len(result), "trend_path": str(trend_file)})
+            save_checkpoint("trends", today, dict(artifacts))
+        elif stage == "news":
+            artifacts["collected_count"] = len(result)
+            save_checkpoint("collected", today, dict(artifacts))
+        elif stage == "fresh":
+            artifacts["fresh_count"] = len(result)
+            save_checkpoint("deduped", today, dict(artifacts))
+
+    # trend (RSS + Playwright) và news không phụ thuộc nhau -> chạy chồng lên nhau
+    results = _run_stages(
+        {
+            "feeds": (lambda: load_feeds(TREND_SOURCES + RSS_SOURCES), []),
+            "playwright": (collect_trends_playwright, []),
+            "trends": (lambda feeds, pw: _merge_trends(pw, collect_trends_rss(feeds=feeds)), ["feeds", "playwright"]),
+            "news": (lambda feeds: collect_news(feeds=feeds), ["feeds"]),
+            "fresh": (dedupe_new, ["news"]),
+            "scored": (score_items, ["fresh", "trends"]),
+        },
+        on_done,
+    )
+    trends, fresh, scored = results["trends"], results["fresh"], results["scored"]
+
+    scored_file = OUTPUTS / f"scored_{today}.json"
+    scored_file.write_text(
+        json.dumps(
+            [{"title": i["title"], "link": i["link"], "score": sc, "trend_hits": hits} for i, (sc, hits) in zip(fresh, scored)],
+            ensure_ascii=False,
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    top = pick_top(fresh, trends=trends, top_k=3, scored=scored)
     script = build_script(top, trends=trends)
     packaging = generate_packaging(top, trends)
 
     out = OUTPUTS / f"script_{today}.txt"
     out.write_text(script, encoding="utf-8")
 
+    # mỗi tin trong top_k có script riêng để batch render ra nhiều clip;
+    # xoá script tin của lần chạy trước trong ngày để batch_render (glob script_<ngày>_*.txt) không render tin cũ
+    for old in OUTPUTS.glob(f"script_{today}_*.txt"):
+        if old.stem[len(f"script_{today}_") :].isdigit():
+            old.unlink(missing_ok=True)
+    story_scripts = []
+    for n, item in enumerate(top, start=1):
+        story_out = OUTPUTS / f"script_{today}_{n}.txt"
+        story_out.write_text(build_script([item], trends=trends), encoding="utf-8")
+        story_scripts.append(str(story_out))
+
     meta_out = OUTPUTS / f"packaging_{today}.json"
     meta_out.write_text(json.dumps(packaging, ensure_ascii=False, indent=2), encoding="utf-8")
 
     persist_seen(fresh)
+    maintain_storage()
     save_checkpoint(
         "scripted",
         today,
         {
             **artifacts,
             "script_path": str(out),
+            "story_script_paths": story_scripts,
             "packaging_path": str(meta_out),
+            "scored_path": str(scored_file),
             "top": top,
-            "trend_count": len(trends),
-            "trend_path": str(trend_file),
         },
     )
     return out
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, List
+
+from file_cache import FileCache, file_digests
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "data"
+RENDER_CACHE_DIR = DATA / "render_cache"
+RENDER_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+RENDER_CACHE_MAX_AGE_DAYS = 14
+INPUT_HASHES = RENDER_CACHE_DIR / "inputs.json"
+
+# đổi cách dựng fingerprint thì tăng version để entry cũ không bị dùng nhầm
+RENDER_CACHE_VERSION = 1
+
+_cache = FileCache(RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES, max_age_days=RENDER_CACHE_MAX_AGE_DAYS, suffix=".mp4")
+
+
+def fingerprint(cmds: List[List[str]], inputs: List[Path], aliases: Dict[str, str] | None = None) -> str:
+    # key = toàn bộ lệnh ffmpeg (filter graph + encode args) với path input thay bằng hash nội dung;
+    # aliases thay các path phụ thuộc tên output (file output, thư mục tạm) bằng placeholder cố định
+    digests = file_digests(inputs, INPUT_HASHES)
+    replacements = {str(p): f"<{digests[p]}>" for p in inputs}
+    replacements.update(aliases or {})
+    # thay path dài trước để path con không bị thay dở
+    order = sorted(replacements, key=len, reverse=True)
+
+    normalized = []
+    for cmd in cmds:
+        args = []
+        for arg in cmd:
+            for old in order:
+                arg = arg.replace(old, replacements[old])
+            args.append(arg)
+        normalized.append(args)
+    raw = json.dumps({"v": RENDER_CACHE_VERSION, "cmds": normalized}, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def restore(key: str, video_path: Path) -> bool:
+    hit = _cache.get(key)
+    if hit is None:
+        return False
+    # copy chứ không hardlink: ffmpeg -y ghi đè bằng truncate sẽ làm hỏng bản trong cache
+    tmp = video_path.with_name(f".{video_path.name}.restore")
+    shutil.copyfile(hit["path"], tmp)
+    tmp.replace(video_path)
+    return True
+
+
+def store(key: str, video_path: Path, meta: Dict | None = None) -> None:
+    _cache.put(key, video_path, meta)
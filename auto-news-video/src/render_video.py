@@ -1,20 +1,43 @@
+import concurrent.futures as cf
 import datetime as dt
+import hashlib
 import json
+import os
 import re
 import shutil
 import subprocess
+import tempfile
+import time
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
-from gtts import gTTS
+from broll_proxy import ensure_proxies
+from event_bus import emit, flush as flush_events
+from ffmpeg_caps import has_filter, probe
+from file_cache import FileCache
+from render_cache import fingerprint, restore, store
+from tts import split_sentences, synthesize_segments
 
 ROOT = Path(__file__).resolve().parents[1]
 OUTPUTS = ROOT / "outputs"
+OVERLAY_DIR = ROOT / "data" / "overlays"
+OVERLAY_MAX_BYTES = 256 * 1024 * 1024
+OVERLAY_MAX_AGE_DAYS = 30
 ASSETS = ROOT / "assets"
 BROLL_DIR = ASSETS / "broll"
 BGM_FILE = ASSETS / "bgm.mp3"
 STYLE_FILE = ROOT / "config" / "style.json"
 
+PROGRESS_INTERVAL_SEC = 2.0
+
+# profile encode: draft-preview cho review nhanh, publish cho bản đăng, shorts-capped giới hạn dung lượng file
+DEFAULT_ENCODE_PROFILE = "publish"
+ENCODE_PROFILES = {
+    "draft-preview": {"width": 540, "height": 960, "preset": "ultrafast", "crf": 28, "audio_bitrate": "96k", "gop": 60, "threads": 0},
+    "publish": {"width": 1080, "height": 1920, "preset": "medium", "crf": 20, "audio_bitrate": "192k", "gop": 60, "threads": 0},
+    "shorts-capped": {"width": 1080, "height": 1920, "preset": "medium", "crf": 21, "max_mb": 50, "audio_bitrate": "128k", "gop": 60, "threads": 0},
+}
+
 
 def _clean_lines(script_text: str) -> List[str]:
     lines = []
@@ -86,39 +109,82 @@ def _build_timed_subtitles(chunks: List[str], total_duration: float) -> List[Tup
     return entries
 
 
-def _write_subtitles(lines: List[str], total_duration: float, out_srt: Path) -> None:
-    chunks = _chunk_for_pacing(lines)
-    timed = _build_timed_subtitles(chunks, total_duration)
-
-    parts = []
-    for i, (start, end, text) in enumerate(timed, start=1):
-        parts.append(f"{i}\n{_to_srt_time(start)} --> {_to_srt_time(end)}\n{text}\n")
-    out_srt.write_text("\n".join(parts), encoding="utf-8")
-
-
-def _ffmpeg_has_filter(ffmpeg_bin: str, filter_name: str) -> bool:
-    try:
-        out = subprocess.run([ffmpeg_bin, "-hide_banner", "-filters"], capture_output=True, text=True, check=False)
-        text = (out.stdout or "") + "\n" + (out.stderr or "")
-        return filter_name in text
-    except Exception:
-        return False
+def _segment_spans(segments: List[Tuple[str, float]]) -> List[Tuple[float, float, str]]:
+    spans = []
+    cur = 0.0
+    for text, dur in segments:
+        spans.append((cur, cur + dur, text))
+        cur += dur
+    return spans
 
 
-def _audio_duration_sec(path: Path) -> float:
-    ffprobe = shutil.which("ffprobe")
-    if not ffprobe:
-        return 45.0
+def _silence_midpoints(ffmpeg_bin: str, audio_path: Path, noise_db: int = -35, min_silence: float = 0.2) -> List[float]:
     result = subprocess.run(
-        [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", str(path)],
+        [ffmpeg_bin, "-hide_banner", "-nostats", "-i", str(audio_path), "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"],
         capture_output=True,
         text=True,
         check=False,
     )
-    try:
-        return max(1.0, float(result.stdout.strip()))
-    except Exception:
-        return 45.0
+    starts = [float(x) for x in re.findall(r"silence_start: (-?[\d.]+)", result.stderr or "")]
+    ends = [float(x) for x in re.findall(r"silence_end: (-?[\d.]+)", result.stderr or "")]
+    return [(a + b) / 2 for a, b in zip(starts, ends)]
+
+
+def _snap_spans(spans: List[Tuple[float, float, str]], silences: List[float], tolerance: float = 0.6) -> List[Tuple[float, float, str]]:
+    # dời ranh giới giữa 2 câu về khoảng lặng gần nhất (nếu đủ gần)
+    if not silences or len(spans) < 2:
+        return spans
+    bounds = [spans[0][0]] + [end for _, end, _ in spans]
+    for i in range(1, len(bounds) - 1):
+        nearest = min(silences, key=lambda x: abs(x - bounds[i]))
+        if abs(nearest - bounds[i]) <= tolerance and bounds[i - 1] < nearest < bounds[i + 1]:
+            bounds[i] = nearest
+    return [(bounds[i], bounds[i + 1], text) for i, (_, _, text) in enumerate(spans)]
+
+
+def _aligned_subtitles(spans: List[Tuple[float, float, str]], total_duration: float) -> List[Tuple[float, float, str]]:
+    # mỗi câu có mốc thật từ audio; chỉ chia theo số từ bên trong 1 câu
+    entries = []
+    for start, end, text in spans:
+        chunks = _chunk_for_pacing([text])
+        weights = [max(1, len(c.split())) for c in chunks]
+        total_w = sum(weights)
+        cur = start
+        for c, w in zip(chunks, weights):
+            nxt = cur + (end - start) * w / total_w
+            entries.append((cur, nxt, c))
+            cur = nxt
+    if entries:
+        s, _, t = entries[-1]
+        entries[-1] = (s, total_duration, t)
+    return entries
+
+
+def _write_subtitles(
+    lines: List[str],
+    total_duration: float,
+    out_srt: Path,
+    spans: List[Tuple[float, float, str]] | None = None,
+) -> None:
+    if spans:
+        timed = _aligned_subtitles(spans, total_duration)
+    else:
+        chunks = _chunk_for_pacing(lines)
+        timed = _build_timed_subtitles(chunks, total_duration)
+
+    parts = []
+    for i, (start, end, text) in enumerate(timed, start=1):
+        parts.append(f"{i}\n{_to_srt_time(start)} --> {_to_srt_time(end)}\n{text}\n")
+    out_srt.write_text("\n".join(parts), encoding="utf-8")
+
+
+def _write_segment_timing(segments: List[Tuple[str, float]], out_json: Path) -> None:
+    entries = []
+    cur = 0.0
+    for text, dur in segments:
+        entries.append({"text": text, "start": round(cur, 3), "end": round(cur + dur, 3)})
+        cur += dur
+    out_json.write_text(json.dumps(entries, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
 def _extract_headline(script_text: str) -> str:
@@ -146,6 +212,14 @@ def _load_style() -> dict:
         "lower_third_bg_alpha": 0.38,
         "subtitle_fontsize": 18,
         "headline_fontsize": 56,
+        "subtitle_timing": "segments",
+        "broll_proxy": True,
+        "broll_max_clips": 4,
+        "static_overlay": True,
+        "segmented_render": False,
+        "segment_seconds": 10,
+        "segment_workers": 0,
+        "render_cache": True,
     }
     if not STYLE_FILE.exists():
         return defaults
@@ -157,88 +231,330 @@ def _load_style() -> dict:
     return defaults
 
 
-def render_from_script(script_path: Path) -> Path:
-    if not script_path.exists():
-        raise FileNotFoundError(f"Missing script file: {script_path}")
+def load_encode_profile(name: str | None = None) -> dict:
+    profiles = {k: dict(v) for k, v in ENCODE_PROFILES.items()}
+    default = DEFAULT_ENCODE_PROFILE
+    if STYLE_FILE.exists():
+        try:
+            data = json.loads(STYLE_FILE.read_text(encoding="utf-8"))
+            default = str(data.get("encode_profile", default))
+            for k, v in (data.get("encode_profiles") or {}).items():
+                if isinstance(v, dict):
+                    profiles.setdefault(k, {}).update(v)
+        except Exception:
+            pass
+    name = name or default
+    if name not in profiles:
+        raise ValueError(f"Unknown encode profile: {name} (available: {', '.join(profiles)})")
+    return {**ENCODE_PROFILES[DEFAULT_ENCODE_PROFILE], **profiles[name], "name": name}
+
+
+def _bitrate_kbps(value) -> float:
+    # theo cú pháp bitrate của ffmpeg: số trần là bit/s, hậu tố k/M/G (SI, thêm "i" là 1024), "B" = byte
+    m = re.fullmatch(r"\s*([\d.]+)\s*([kKMG]?)(i?)(B?)\s*", str(value))
+    if not m:
+        raise ValueError(f"Invalid bitrate: {value!r}")
+    number, prefix, binary, byte = m.groups()
+    power = " KMG".index(prefix.upper()) if prefix else 0
+    bits = float(number) * (1024 if binary else 1000) ** power * (8 if byte else 1)
+    return bits / 1000
+
+
+def _video_encode_args(profile: dict, duration: float) -> List[str]:
+    args = ["-c:v", "libx264", "-preset", str(profile["preset"])]
+    if profile.get("bitrate"):
+        args += ["-b:v", str(profile["bitrate"])]
+    else:
+        args += ["-crf", str(profile["crf"])]
+    if profile.get("max_mb"):
+        # trần bitrate để file <= max_mb (chừa ~5% cho container + audio); crf vẫn quyết định ở cảnh dễ
+        audio_kbps = _bitrate_kbps(profile["audio_bitrate"])
+        video_kbps = max(300, int(float(profile["max_mb"]) * 8192 * 0.95 / max(1.0, duration) - audio_kbps))
+        args += ["-maxrate", f"{video_kbps}k", "-bufsize", f"{video_kbps * 2}k"]
+    if profile.get("gop"):
+        args += ["-g", str(profile["gop"]), "-keyint_min", str(profile["gop"])]
+    return args + ["-pix_fmt", "yuv420p"]
+
+
+def _encode_args(profile: dict, duration: float) -> List[str]:
+    return _video_encode_args(profile, duration) + ["-c:a", "aac", "-b:a", str(profile["audio_bitrate"])]
+
+
+def _audio_filter(narration_idx: int, bgm_idx: int | None, duration: float) -> str:
+    if bgm_idx is None:
+        return f"[{narration_idx}:a]anull[aout]"
+    return (
+        f"[{bgm_idx}:a]atrim=0:{duration:.3f},asetpts=N/SR/TB,volume=0.22[bgm];"
+        f"[bgm][{narration_idx}:a]sidechaincompress=threshold=0.03:ratio=12:attack=20:release=300[ducked];"
+        f"[{narration_idx}:a][ducked]amix=inputs=2:weights='1 0.7':normalize=0[aout]"
+    )
 
-    ffmpeg = shutil.which("ffmpeg")
-    if not ffmpeg:
-        raise RuntimeError("ffmpeg chưa cài. Cài trước: sudo apt install ffmpeg")
 
-    run_id = dt.datetime.utcnow().strftime("%Y-%m-%d")
-    audio_path = OUTPUTS / f"voice_{run_id}.mp3"
-    srt_path = OUTPUTS / f"sub_{run_id}.srt"
-    video_path = OUTPUTS / f"video_{run_id}.mp4"
+def _parse_number(value: str | None) -> float | None:
+    # ffmpeg -progress: "1234.5kbits/s", "1.5x", "N/A"...
+    m = re.match(r"\s*(-?[\d.]+)", value or "")
+    return float(m.group(1)) if m else None
 
-    script_text = script_path.read_text(encoding="utf-8")
-    lines = _clean_lines(script_text)
-    narration = " ".join(lines) if lines else "Bản tin hôm nay chưa có dữ liệu phù hợp."
 
-    tts = gTTS(text=narration, lang="vi")
-    tts.save(str(audio_path))
+def _progress_data(sample: Dict[str, str], duration: float) -> Dict:
+    out_us = _parse_number(sample.get("out_time_us") or sample.get("out_time_ms"))
+    out_time = max(0.0, out_us / 1e6) if out_us is not None else None
+    speed = _parse_number(sample.get("speed"))
+    data = {
+        "frames": int(_parse_number(sample.get("frame")) or 0),
+        "fps": _parse_number(sample.get("fps")),
+        "speed": speed,
+        "bitrate_kbps": _parse_number(sample.get("bitrate")),
+        "out_time": round(out_time, 3) if out_time is not None else None,
+    }
+    if out_time is not None and duration > 0:
+        data["percent"] = round(min(100.0, out_time * 100 / duration), 1)
+        if speed:
+            data["eta_sec"] = round(max(0.0, duration - out_time) / speed, 1)
+    return data
+
+
+def _run_ffmpeg(cmd: List[str], run_id: str, stage: str, duration: float) -> None:
+    # thêm -progress vào trước output, đọc block key=value và emit mẫu throughput (tối đa 1 lần / PROGRESS_INTERVAL_SEC)
+    cmd = cmd[:-1] + ["-progress", "pipe:1", "-nostats", cmd[-1]]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    sample: Dict[str, str] = {}
+    last = 0.0
+    for line in proc.stdout:
+        key, _, value = line.strip().partition("=")
+        if key != "progress":
+            sample[key] = value
+            continue
+        now = time.monotonic()
+        if value == "end" or now - last >= PROGRESS_INTERVAL_SEC:
+            emit(run_id, "agent-producer", "progress", detail=stage, data=_progress_data(sample, duration))
+            last = now
+    if proc.wait() != 0:
+        # ffmpeg lỗi: đẩy progress còn trong buffer ra log trước khi raise (worker process có thể thoát không qua atexit)
+        flush_events()
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def _segment_plan(clip_count: int, seg: float, duration: float, gop: int, chunk_sec: float, fps: int = 30) -> List[Tuple[int, int, int, int]]:
+    # (clip, frame bắt đầu trong clip, frame bắt đầu/kết thúc trên timeline); cắt ở điểm đổi b-roll
+    # và mỗi ~chunk_sec, mọi mốc làm tròn theo GOP để mỗi đoạn mở đầu đúng 1 keyframe của lưới GOP
+    total = max(1, int(round(duration * fps)))
+    chunk = max(gop, int(round(chunk_sec * fps / gop)) * gop)
+    plan = []
+    for i in range(clip_count):
+        start = int(round(i * seg * fps / gop)) * gop
+        if start >= total:
+            break
+        last = i == clip_count - 1 or (i + 1) * seg >= duration
+        end = total if last else min(total, int(round((i + 1) * seg * fps / gop)) * gop)
+        for a in range(start, end, chunk):
+            plan.append((i, a - start, a, min(a + chunk, end)))
+        if last:
+            break
+    return plan
+
+
+def _clip_frames(ffmpeg: str, path: Path, fps: int = 30) -> int | None:
+    # proxy là CFR 30fps -> số frame suy từ Duration của container (đọc header qua `ffmpeg -i`, không decode, không cần ffprobe)
+    result = subprocess.run([ffmpeg, "-hide_banner", "-i", str(path)], capture_output=True, text=True, check=False)
+    m = re.search(r"Duration:\s*(\d+):(\d+):([\d.]+)", result.stderr)
+    if not m:
+        return None
+    frames = int(round((int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))) * fps))
+    return frames or None
+
+
+def _segment_input(path: Path, normalized: bool, local_start: int, length: int, clip_frames: int | None) -> Tuple[List[str], int]:
+    # (args input, frame còn phải trim ở đầu); b-roll lặp vô hạn nên vị trí trong clip là local_start mod độ dài clip.
+    # Đoạn nằm gọn trong 1 vòng clip -> seek ngay ở input (proxy GOP 1s, chỉ decode từ keyframe gần nhất);
+    # đoạn vắt qua điểm lặp -> loop từ đầu clip, trim phần lẻ (<1 vòng) thay vì decode lại từ frame 0 của timeline.
+    # -ss không dùng chung được với -stream_loop: mỗi vòng lặp ffmpeg lại seek về đúng điểm -ss
+    if not normalized or not clip_frames:
+        return ["-stream_loop", "-1", "-i", str(path)], local_start
+    offset = local_start % clip_frames
+    if offset + length <= clip_frames:
+        return ["-ss", f"{offset / 30:.6f}", "-i", str(path)], 0
+    return ["-stream_loop", "-1", "-i", str(path)], offset
+
+
+def _segment_work_dir(video_path: Path) -> Path:
+    return video_path.parent / f".{video_path.stem}_segments"
+
+
+def _segmented_commands(
+    ffmpeg: str,
+    broll_inputs: List[Tuple[Path, bool]],
+    plan: List[Tuple[int, int, int, int]],
+    overlay: Tuple[List[str], List[str], List[str], Path | None],
+    size: Tuple[int, int],
+    audio_path: Path,
+    duration: float,
+    encode: dict,
+    threads: int | None,
+    workers: int,
+    video_path: Path,
+) -> Tuple[List[Tuple[List[str], str, float]], List[str], int]:
+    # trả về (lệnh encode từng đoạn + nhãn + thời lượng, lệnh concat/mux, số worker)
+    width, height = size
+    moving, static, dynamic, static_layer = overlay
+    visual_overlay = _visual_overlay(moving, static, dynamic, static_layer, 1)
+    work_dir = _segment_work_dir(video_path)
+
+    cpu = os.cpu_count() or 1
+    workers = max(1, min(len(plan), workers or cpu))
+    seg_threads = max(1, (threads or cpu) // workers)
+
+    clip_frames = {clip: _clip_frames(ffmpeg, broll_inputs[clip][0]) for clip in {c for c, _, _, _ in plan} if broll_inputs[clip][1]}
+    jobs = []
+    for n, (clip, local_start, a, b) in enumerate(plan):
+        path, normalized = broll_inputs[clip]
+        source, skip = _segment_input(path, normalized, local_start, b - a, clip_frames.get(clip))
+        normalize = "" if normalized else (
+            f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+            f"crop={width}:{height},eq=saturation=1.08:contrast=1.06:brightness=0.01,"
+        )
+        resize = f"scale={width}:{height}," if normalized and (width, height) != (1080, 1920) else ""
+        # overlay/subtitle/box chạy theo t -> dời PTS về đúng vị trí trên timeline, encode xong đưa lại về 0 cho concat
+        chain = (
+            f"[0:v]fps=30,trim=start_frame={skip}:end_frame={skip + b - a},{normalize}{resize}"
+            f"setpts=PTS-STARTPTS+{a}/(30*TB),{visual_overlay},setpts=PTS-STARTPTS[vout]"
+        )
+        part = work_dir / f"{n:03d}.mp4"
+        cmd = [ffmpeg, "-y", "-v", "error", *source]
+        if static_layer is not None:
+            cmd += ["-i", str(static_layer)]
+        cmd += ["-filter_complex", chain, "-map", "[vout]", "-an", "-r", "30", *_video_encode_args(encode, duration), "-threads", str(seg_threads), str(part)]
+        jobs.append((cmd, f"{video_path.stem} segment {n + 1}/{len(plan)}", (b - a) / 30))
+
+    # nối video không re-encode, audio (voice + bgm ducking) mux 1 lần ở cuối
+    cmd = [ffmpeg, "-y", "-f", "concat", "-safe", "0", "-i", str(work_dir / "concat.txt"), "-i", str(audio_path)]
+    bgm_idx = None
+    if BGM_FILE.exists():
+        cmd += ["-stream_loop", "-1", "-i", str(BGM_FILE)]
+        bgm_idx = 2
+    cmd += [
+        "-filter_complex",
+        _audio_filter(1, bgm_idx, duration),
+        "-map",
+        "0:v",
+        "-map",
+        "[aout]",
+        "-c:v",
+        "copy",
+        "-c:a",
+        "aac",
+        "-b:a",
+        str(encode["audio_bitrate"]),
+        "-movflags",
+        "+faststart",
+        "-shortest",
+        str(video_path),
+    ]
+    return jobs, cmd, workers
 
-    duration = _audio_duration_sec(audio_path)
-    _write_subtitles(lines, duration, srt_path)
 
-    style = _load_style()
-    headline = _safe_drawtext_text(_extract_headline(script_text)[:90])
-    watermark = _safe_drawtext_text(str(style["watermark"]))
-    accent_label = _safe_drawtext_text(str(style["accent_label"]))
-    srt_escaped = str(srt_path).replace("\\", "/").replace("'", "\\'")
+def _run_segmented(jobs: List[Tuple[List[str], str, float]], mux_cmd: List[str], workers: int, run_id: str, video_path: Path, duration: float) -> None:
+    work_dir = _segment_work_dir(video_path)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        with cf.ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda job: _run_ffmpeg(job[0], run_id, job[1], job[2]), jobs))
+        parts = [Path(cmd[-1]) for cmd, _, _ in jobs]
+        (work_dir / "concat.txt").write_text("".join(f"file '{p.resolve().as_posix()}'\n" for p in parts), encoding="utf-8")
+        _run_ffmpeg(mux_cmd, run_id, f"{video_path.stem} mux", duration)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
-    broll_candidates = sorted([p for p in BROLL_DIR.glob("*.mp4") if p.is_file()]) if BROLL_DIR.exists() else []
-    broll_candidates = broll_candidates[:4]
-    use_broll = len(broll_candidates) > 0
-    use_bgm = BGM_FILE.exists()
 
-    subtitle_fontsize = int(style["subtitle_fontsize"])
-    headline_fontsize = int(style["headline_fontsize"])
-    accent_color = str(style["accent_color_hex"])
-    lower_bg = str(style["lower_third_bg_hex"])
-    lower_alpha = float(style["lower_third_bg_alpha"])
-    headline_color = str(style["headline_color"])
+_overlay_cache = FileCache(OVERLAY_DIR, max_bytes=OVERLAY_MAX_BYTES, max_age_days=OVERLAY_MAX_AGE_DAYS, suffix=".png")
 
-    has_drawtext = _ffmpeg_has_filter(ffmpeg, " drawtext ")
-    has_subtitles = _ffmpeg_has_filter(ffmpeg, " subtitles ")
-    has_xfade = _ffmpeg_has_filter(ffmpeg, " xfade ")
 
-    overlays = [
-        "drawbox=x='mod(t*120,1080)':y=80:w=360:h=220:color=0x2563eb@0.15:t=fill",
-        "drawbox=x='1080-mod(t*90,1400)':y=1460:w=520:h=320:color=0x7c3aed@0.14:t=fill",
-        "drawbox=x=0:y=0:w=1080:h=180:color=black@0.35:t=fill",
-        f"drawbox=x=0:y=1740:w=1080:h=180:color={lower_bg}@{lower_alpha}:t=fill",
-        f"drawbox=x=32:y=200:w=300:h=64:color={accent_color}@0.28:t=fill",
-    ]
-    if has_drawtext:
-        overlays += [
-            f"drawtext=text='{accent_label}':fontcolor=white:fontsize=28:x=52:y=218",
-            f"drawtext=text='{headline}':fontcolor={headline_color}:fontsize={headline_fontsize}:x=(w-text_w)/2:y=50",
-            f"drawtext=text='{watermark}':fontcolor=white@0.82:fontsize=30:x=40:y=1798",
-        ]
-    if has_subtitles:
-        overlays += [
-            f"subtitles='{srt_escaped}':force_style='FontName=Arial,FontSize={subtitle_fontsize},PrimaryColour=&H00FFFFFF,"
-            "OutlineColour=&H00000000,BackColour=&H50000000,BorderStyle=3,Outline=1.2,Shadow=0,MarginV=120,Alignment=2'"
-        ]
-
-    visual_overlay = ",".join(overlays)
+def _texts_write_alpha(ffmpeg: str, texts: List[str], width: int, height: int) -> bool:
+    # drawtext có ghi alpha lên canvas trong suốt không (tuỳ bản ffmpeg); không ghi thì chữ nướng vào PNG sẽ vô hình
+    result = subprocess.run(
+        [ffmpeg, "-v", "error", "-f", "lavfi", "-i", f"color=c=black@0.0:s={width}x{height},format=rgba", "-vf", ",".join(texts), "-frames:v", "1", "-f", "rawvideo", "-pix_fmt", "rgba", "pipe:1"],
+        capture_output=True,
+        check=False,
+    )
+    return result.returncode == 0 and any(result.stdout[3::4])
+
+
+def _static_overlay_layer(ffmpeg: str, boxes: List[str], texts: List[str], width: int = 1080, height: int = 1920) -> Tuple[Path | None, List[str]]:
+    # branding không đổi theo thời gian -> vẽ 1 lần ra PNG trong suốt, cache theo hash của chính các filter (LRU theo size/tuổi);
+    # trả về (PNG, các drawtext tĩnh vẫn phải vẽ theo frame vì không nướng được vào PNG)
+    key = hashlib.sha256(json.dumps({"boxes": boxes, "texts": texts, "size": [width, height]}, ensure_ascii=False).encode("utf-8")).hexdigest()
+    hit = _overlay_cache.get(key)
+    if hit is not None:
+        return hit["path"], [] if hit.get("texts_baked", True) else texts
+
+    baked = not texts or _texts_write_alpha(ffmpeg, texts, width, height)
+    OVERLAY_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=".static_", suffix=".png", dir=OVERLAY_DIR)
+    os.close(fd)
+    tmp = Path(tmp_name)
+    try:
+        # replace=1: ghi thẳng màu + alpha của box vào canvas trong suốt, overlay sau đó blend y như drawbox gốc
+        graph = ",".join([f"{b}:replace=1" for b in boxes] + (texts if baked else [])) or "null"
+        result = subprocess.run(
+            [ffmpeg, "-y", "-v", "error", "-f", "lavfi", "-i", f"color=c=black@0.0:s={width}x{height},format=rgba", "-vf", graph, "-frames:v", "1", str(tmp)],
+            check=False,
+        )
+        if result.returncode != 0 or tmp.stat().st_size == 0:
+            return None, texts
+        path = _overlay_cache.put(key, tmp, {"texts_baked": baked}, move=True)
+    finally:
+        tmp.unlink(missing_ok=True)
+    # PNG kiểu cũ (static_<hash>.png) không nằm trong index của cache -> dọn 1 lần
+    for old in OVERLAY_DIR.glob("static_*.png"):
+        old.unlink(missing_ok=True)
+    return path, [] if baked else texts
+
+
+def _visual_overlay(moving: List[str], static: List[str], dynamic: List[str], static_layer: Path | None, layer_idx: int) -> str:
+    if static_layer is None:
+        return ",".join(moving + static + dynamic)
+    # 1 overlay thay cho các drawbox/drawtext tĩnh; box chạy, headline, subtitle vẫn vẽ theo frame
+    return ",".join(moving) + f"[pre];[pre][{layer_idx}:v]overlay=0:0[branded];[branded]" + (",".join(dynamic) or "null")
+
+
+def _single_pass_command(
+    ffmpeg: str,
+    broll_inputs: List[Tuple[Path, bool]],
+    overlay: Tuple[List[str], List[str], List[str], Path | None],
+    size: Tuple[int, int],
+    audio_path: Path,
+    duration: float,
+    encode: dict,
+    threads: int | None,
+    has_xfade: bool,
+    video_path: Path,
+) -> List[str]:
+    width, height = size
+    moving_boxes, static, dynamic, static_layer = overlay
+    use_broll = len(broll_inputs) > 0
+    use_bgm = BGM_FILE.exists()
 
     if use_broll:
         cmd = [ffmpeg, "-y"]
-        for p in broll_candidates:
+        for p, _ in broll_inputs:
             cmd += ["-stream_loop", "-1", "-i", str(p)]
         cmd += ["-i", str(audio_path)]
 
-        clip_count = len(broll_candidates)
+        clip_count = len(broll_inputs)
         transition = 0.35
         seg = max(2.4, duration / clip_count)
 
         chains = []
-        for i in range(clip_count):
+        for i, (_, normalized) in enumerate(broll_inputs):
+            if normalized:
+                # proxy đã 30fps; fps=30 ở đây chỉ gắn frame rate cố định cho xfade (không resample)
+                resize = f"scale={width}:{height}," if (width, height) != (1080, 1920) else ""
+                chains.append(f"[{i}:v]trim=duration={seg + transition:.3f},setpts=PTS-STARTPTS,{resize}fps=30[v{i}]")
+                continue
             chains.append(
                 f"[{i}:v]trim=duration={seg + transition:.3f},setpts=PTS-STARTPTS,"
-                "scale=1080:1920:force_original_aspect_ratio=increase,"
-                "crop=1080:1920,eq=saturation=1.08:contrast=1.06:brightness=0.01,fps=30"
+                f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+                f"crop={width}:{height},eq=saturation=1.08:contrast=1.06:brightness=0.01,fps=30"
                 f"[v{i}]"
             )
 
@@ -254,10 +570,14 @@ def render_from_script(script_path: Path) -> Path:
                 current = next_label
             base_label = current
 
-        video_filter = ";".join(chains) + f";[{base_label}]{visual_overlay}[vout]"
         narration_idx = clip_count
         bgm_idx = clip_count + 1
+        visual_overlay = _visual_overlay(moving_boxes, static, dynamic, static_layer, bgm_idx + int(use_bgm))
+        video_filter = ";".join(chains) + f";[{base_label}]{visual_overlay}[vout]"
     else:
+        narration_idx = 1
+        bgm_idx = 2
+        visual_overlay = _visual_overlay(moving_boxes, static, dynamic, static_layer, bgm_idx + int(use_bgm))
         video_filter = (
             f"[0:v]fade=t=in:st=0:d=0.45,fade=t=out:st={max(0.0, duration - 0.45):.2f}:d=0.45,"
             f"{visual_overlay}[vout]"
@@ -268,22 +588,16 @@ def render_from_script(script_path: Path) -> Path:
             "-f",
             "lavfi",
             "-i",
-            f"color=c=#0b1020:s=1080x1920:d={duration},format=yuv420p",
+            f"color=c=#0b1020:s={width}x{height}:d={duration},format=yuv420p",
             "-i",
             str(audio_path),
         ]
-        narration_idx = 1
-        bgm_idx = 2
 
     if use_bgm:
         cmd += ["-stream_loop", "-1", "-i", str(BGM_FILE)]
-        audio_filter = (
-            f"[{bgm_idx}:a]atrim=0:{duration:.3f},asetpts=N/SR/TB,volume=0.22[bgm];"
-            f"[bgm][{narration_idx}:a]sidechaincompress=threshold=0.03:ratio=12:attack=20:release=300[ducked];"
-            f"[{narration_idx}:a][ducked]amix=inputs=2:weights='1 0.7':normalize=0[aout]"
-        )
-    else:
-        audio_filter = f"[{narration_idx}:a]anull[aout]"
+    audio_filter = _audio_filter(narration_idx, bgm_idx if use_bgm else None, duration)
+    if static_layer is not None:
+        cmd += ["-i", str(static_layer)]
 
     filter_complex = video_filter + ";" + audio_filter
 
@@ -294,20 +608,208 @@ def render_from_script(script_path: Path) -> Path:
         "[vout]",
         "-map",
         "[aout]",
-        "-c:v",
-        "libx264",
-        "-preset",
-        "medium",
-        "-crf",
-        "20",
-        "-c:a",
-        "aac",
-        "-b:a",
-        "192k",
+        *_encode_args(encode, duration),
         "-movflags",
         "+faststart",
         "-shortest",
-        str(video_path),
     ]
-    subprocess.run(cmd, check=True)
+    threads = threads or int(encode.get("threads") or 0)
+    if threads:
+        cmd += ["-threads", str(threads)]
+    cmd.append(str(video_path))
+    return cmd
+
+
+def _emit_timings(run_id: str, video_path: Path, encode: dict, duration: float, timings: Dict[str, float], cache: str | None = None) -> None:
+    total = round(sum(timings.values()), 3)
+    data = {
+        "stages": timings,
+        "total_sec": total,
+        "profile": encode["name"],
+        "cache": cache,
+        "media_sec": round(duration, 3),
+        # > 1: render nhanh hơn thời lượng video
+        "realtime_factor": round(duration / total, 2) if total > 0 else None,
+    }
+    emit(run_id, "agent-producer", "timing", artifact=str(video_path), detail=f"{video_path.stem} render timing", data=data)
+
+
+def render_from_script(
+    script_path: Path,
+    out_stem: str | None = None,
+    threads: int | None = None,
+    profile: str | None = None,
+    run_id: str | None = None,
+) -> Path:
+    if not script_path.exists():
+        raise FileNotFoundError(f"Missing script file: {script_path}")
+
+    # thời gian từng stage, emit 1 record "timing" khi render xong
+    timings: Dict[str, float] = {}
+    clock = time.monotonic()
+
+    def lap(stage: str) -> None:
+        nonlocal clock
+        now = time.monotonic()
+        timings[stage] = round(now - clock, 3)
+        clock = now
+
+    encode = load_encode_profile(profile)
+    caps = probe()
+    ffmpeg = caps["ffmpeg"]
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg chưa cài. Cài trước: sudo apt install ffmpeg")
+    lap("probe")
+
+    run_id = run_id or dt.datetime.utcnow().strftime("%Y-%m-%d")
+    stem = out_stem or dt.datetime.utcnow().strftime("%Y-%m-%d")
+    OUTPUTS.mkdir(parents=True, exist_ok=True)
+    audio_path = OUTPUTS / f"voice_{stem}.mp3"
+    srt_path = OUTPUTS / f"sub_{stem}.srt"
+    timing_path = OUTPUTS / f"voice_{stem}.json"
+    video_path = OUTPUTS / f"video_{stem}.mp4"
+
+    script_text = script_path.read_text(encoding="utf-8")
+    lines = _clean_lines(script_text)
+    narration = " ".join(lines) if lines else "Bản tin hôm nay chưa có dữ liệu phù hợp."
+
+    segments = synthesize_segments(split_sentences(lines) or [narration], audio_path)
+    duration = max(1.0, sum(d for _, d in segments))
+    _write_segment_timing(segments, timing_path)
+    lap("tts")
+
+    style = _load_style()
+    # segments: mốc theo duration TTS từng câu; silence: tinh chỉnh thêm bằng silencedetect; weighted: kiểu cũ
+    timing_mode = str(style["subtitle_timing"])
+    spans = None
+    if timing_mode == "segments":
+        spans = _segment_spans(segments)
+    elif timing_mode == "silence":
+        spans = _snap_spans(_segment_spans(segments), _silence_midpoints(ffmpeg, audio_path))
+    _write_subtitles(lines, duration, srt_path, spans=spans)
+    lap("subtitles")
+
+    headline = _safe_drawtext_text(_extract_headline(script_text)[:90])
+    watermark = _safe_drawtext_text(str(style["watermark"]))
+    accent_label = _safe_drawtext_text(str(style["accent_label"]))
+    srt_escaped = str(srt_path).replace("\\", "/").replace("'", "\\'")
+
+    broll_candidates = sorted([p for p in BROLL_DIR.glob("*.mp4") if p.is_file()]) if BROLL_DIR.exists() else []
+    broll_candidates = broll_candidates[: max(1, int(style["broll_max_clips"]))]
+    # proxy: clip đã scale/crop/grade/30fps sẵn (cache theo hash nội dung) -> graph chính chỉ còn trim
+    if broll_candidates and style["broll_proxy"]:
+        broll_inputs = ensure_proxies(broll_candidates)
+    else:
+        broll_inputs = [(p, False) for p in broll_candidates]
+    use_broll = len(broll_inputs) > 0
+    use_bgm = BGM_FILE.exists()
+    lap("broll")
+
+    # layout thiết kế cho 1080x1920; profile nhỏ hơn (preview) vẽ thẳng ở độ phân giải đó, mọi toạ độ nhân theo tỉ lệ
+    width, height = int(encode["width"]), int(encode["height"])
+    k = height / 1920
+
+    def px(v: float) -> int:
+        return int(round(v * k))
+
+    # subtitle: libass tự scale FontSize theo chiều cao video
+    subtitle_fontsize = int(style["subtitle_fontsize"])
+    headline_fontsize = px(int(style["headline_fontsize"]))
+    accent_color = str(style["accent_color_hex"])
+    lower_bg = str(style["lower_third_bg_hex"])
+    lower_alpha = float(style["lower_third_bg_alpha"])
+    headline_color = str(style["headline_color"])
+
+    has_drawtext = has_filter(caps, "drawtext")
+    has_subtitles = has_filter(caps, "subtitles")
+    has_xfade = has_filter(caps, "xfade")
+
+    moving_boxes = [
+        f"drawbox=x='mod(t*{px(120)},{width})':y={px(80)}:w={px(360)}:h={px(220)}:color=0x2563eb@0.15:t=fill",
+        f"drawbox=x='{width}-mod(t*{px(90)},{px(1400)})':y={px(1460)}:w={px(520)}:h={px(320)}:color=0x7c3aed@0.14:t=fill",
+    ]
+    static_boxes = [
+        f"drawbox=x=0:y=0:w={width}:h={px(180)}:color=black@0.35:t=fill",
+        f"drawbox=x=0:y={px(1740)}:w={width}:h={px(180)}:color={lower_bg}@{lower_alpha}:t=fill",
+        f"drawbox=x={px(32)}:y={px(200)}:w={px(300)}:h={px(64)}:color={accent_color}@0.28:t=fill",
+    ]
+    static_texts = []
+    dynamic = []
+    if has_drawtext:
+        static_texts += [
+            f"drawtext=text='{accent_label}':fontcolor=white:fontsize={px(28)}:x={px(52)}:y={px(218)}",
+            f"drawtext=text='{watermark}':fontcolor=white@0.82:fontsize={px(30)}:x={px(40)}:y={px(1798)}",
+        ]
+        dynamic.append(f"drawtext=text='{headline}':fontcolor={headline_color}:fontsize={headline_fontsize}:x=(w-text_w)/2:y={px(50)}")
+    if has_subtitles:
+        dynamic += [
+            f"subtitles='{srt_escaped}':force_style='FontName=Arial,FontSize={subtitle_fontsize},PrimaryColour=&H00FFFFFF,"
+            "OutlineColour=&H00000000,BackColour=&H50000000,BorderStyle=3,Outline=1.2,Shadow=0,MarginV=120,Alignment=2'"
+        ]
+
+    static_layer = None
+    if style["static_overlay"]:
+        static_layer, unbaked_texts = _static_overlay_layer(ffmpeg, static_boxes, static_texts, width, height)
+        if static_layer is not None:
+            # chữ tĩnh không nướng được vào PNG thì vẽ theo frame, ngay trên lớp branding như thứ tự cũ
+            dynamic = unbaked_texts + dynamic
+    lap("overlay")
+
+    segmented = None
+    if use_broll and style["segmented_render"]:
+        # timeline cắt tại điểm đổi b-roll (hard cut, không xfade), các đoạn encode song song rồi concat -c copy
+        seg = max(2.4, duration / len(broll_inputs))
+        plan = _segment_plan(len(broll_inputs), seg, duration, int(encode.get("gop") or 60), float(style["segment_seconds"]))
+        if len(plan) > 1:
+            segmented = _segmented_commands(
+                ffmpeg,
+                broll_inputs,
+                plan,
+                (moving_boxes, static_boxes + static_texts, dynamic, static_layer),
+                (width, height),
+                audio_path,
+                duration,
+                encode,
+                threads,
+                int(style["segment_workers"]),
+                video_path,
+            )
+
+    if segmented is not None:
+        jobs, mux_cmd, workers = segmented
+        encode_cmds = [job_cmd for job_cmd, _, _ in jobs] + [mux_cmd]
+    else:
+        cmd = _single_pass_command(
+            ffmpeg,
+            broll_inputs,
+            (moving_boxes, static_boxes + static_texts, dynamic, static_layer),
+            (width, height),
+            audio_path,
+            duration,
+            encode,
+            threads,
+            has_xfade,
+            video_path,
+        )
+        encode_cmds = [cmd]
+
+    # cùng script/style/b-roll/bgm/voice/encode -> cùng lệnh ffmpeg -> lấy lại video đã render
+    cache_key = None
+    if style["render_cache"]:
+        inputs = [audio_path, srt_path] + [p for p, _ in broll_inputs] + ([BGM_FILE] if use_bgm else []) + ([static_layer] if static_layer else [])
+        aliases = {str(video_path): "<out>", str(_segment_work_dir(video_path)): "<work>"}
+        cache_key = fingerprint(encode_cmds, inputs, aliases)
+        if restore(cache_key, video_path):
+            lap("encode")
+            _emit_timings(run_id, video_path, encode, duration, timings, cache="hit")
+            return video_path
+
+    if segmented is not None:
+        _run_segmented(jobs, mux_cmd, workers, run_id, video_path, duration)
+    else:
+        _run_ffmpeg(cmd, run_id, f"{stem} encode", duration)
+    if cache_key is not None:
+        store(cache_key, video_path, {"stem": stem, "profile": encode["name"]})
+    lap("encode")
+    _emit_timings(run_id, video_path, encode, duration, timings, cache="miss" if cache_key else None)
     return video_path
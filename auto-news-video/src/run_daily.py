@@ -1,9 +1,10 @@
+import argparse
 import datetime as dt
 import os
 import subprocess
 from pathlib import Path
 
-from orchestrator import run_orchestrated
+from orchestrator import run_orchestrated, wait_master_renders
 from event_bus import emit
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -30,10 +31,17 @@ def open_preview(video_path: Path) -> bool:
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Chạy pipeline hằng ngày + render video")
+    parser.add_argument("--profile", default=None, help="encode profile trong config/style.json (draft-preview, publish, shorts-capped)")
+    parser.add_argument("--preview-profile", default="draft-preview", help="profile của bản preview mở cho review trước khi master encode xong")
+    parser.add_argument("--single-pass", action="store_true", help="bỏ preview, chờ encode xong bản master rồi mới mở")
+    parser.add_argument("--fresh", action="store_true", help="chạy lại pipeline lấy tin mới dù hôm nay đã có script")
+    args = parser.parse_args()
     run_id = dt.datetime.utcnow().strftime("%Y-%m-%d")
 
     try:
-        video_path = run_orchestrated()
+        preview_profile = None if args.single_pass else args.preview_profile
+        video_path = run_orchestrated(profile=args.profile, preview_profile=preview_profile, fresh=args.fresh)
 
         # Skip auto upload for now: always manual review first
         opened = open_preview(video_path)
@@ -41,6 +49,11 @@ def main():
         emit(run_id, "agent-publisher", "waiting_approval", detail="Auto upload disabled. Waiting for manual approval.")
 
         print(f"OK: {video_path}")
+        if preview_profile:
+            print("Master encoding in background, status goes to data/events.jsonl ...")
+            failed = wait_master_renders()
+            if failed:
+                raise RuntimeError("; ".join(f"master render {rid} failed: {err}" for rid, err in failed.items()))
     except Exception as e:
         emit(run_id, "agent-monitor", "error", detail=str(e))
         raise
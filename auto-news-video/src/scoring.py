@@ -0,0 +1,105 @@
+import datetime as dt
+import json
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from matcher import Matcher
+
+ROOT = Path(__file__).resolve().parents[1]
+STYLE_FILE = ROOT / "config" / "style.json"
+
+KEYWORD_BOOST = ["ai", "công nghệ", "startup", "kinh tế", "chính sách", "tiktok", "youtube"]
+CLICKBAIT_TERMS = ["sốc", "không thể tin", "gây bão"]
+
+DEFAULT_WEIGHTS = {
+    "base": 1.0,
+    "keyword": 3.0,
+    "trend": 4.0,
+    "trend_cap": 8.0,
+    "clickbait": -2.0,
+    "published": 1.0,
+    "recency": 0.0,
+    "recency_half_life_hours": 24.0,
+}
+
+# thứ tự cột của ma trận feature
+FEATURES = ["keyword", "trend", "clickbait", "published", "recency"]
+
+
+def load_scoring_config() -> Dict:
+    cfg = {
+        "weights": dict(DEFAULT_WEIGHTS),
+        "keyword_boost": list(KEYWORD_BOOST),
+        "clickbait_terms": list(CLICKBAIT_TERMS),
+    }
+    if not STYLE_FILE.exists():
+        return cfg
+    try:
+        data = json.loads(STYLE_FILE.read_text(encoding="utf-8"))
+        custom = data.get("scoring", {})
+        if not isinstance(custom, dict):
+            return cfg
+        weights = custom.get("weights", {})
+        if isinstance(weights, dict):
+            cfg["weights"].update({k: float(v) for k, v in weights.items() if k in DEFAULT_WEIGHTS})
+        for key in ("keyword_boost", "clickbait_terms"):
+            terms = custom.get(key)
+            if isinstance(terms, list):
+                cfg[key] = [str(t).strip() for t in terms if str(t).strip()]
+    except Exception:
+        pass
+    return cfg
+
+
+def _age_hours(published: str, now: dt.datetime) -> float:
+    if not published:
+        return np.nan
+    try:
+        ts = parsedate_to_datetime(published)
+    except Exception:
+        return np.nan
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=dt.timezone.utc)
+    return max(0.0, (now - ts).total_seconds() / 3600.0)
+
+
+def extract_features(
+    items: List[Dict], matcher: Matcher, half_life_hours: float, now: dt.datetime | None = None
+) -> Tuple[np.ndarray, List[List[str]]]:
+    now = now or dt.datetime.now(dt.timezone.utc)
+    n = len(items)
+    counts = np.zeros((n, 3), dtype=np.float64)
+    published = np.zeros(n, dtype=np.float64)
+    ages = np.full(n, np.nan, dtype=np.float64)
+    trend_hits: List[List[str]] = []
+
+    for row, item in enumerate(items):
+        hits = matcher.find(item["title"])
+        counts[row] = (len(hits["keyword"]), len(hits["trend"]), 1.0 if hits["clickbait"] else 0.0)
+        trend_hits.append(hits["trend"])
+        if item.get("published"):
+            published[row] = 1.0
+            ages[row] = _age_hours(item["published"], now)
+
+    # tin không có ngày đăng (hoặc parse lỗi) -> recency = 0
+    recency = np.where(np.isnan(ages), 0.0, np.exp2(-np.nan_to_num(ages) / max(half_life_hours, 1e-6)))
+    feats = np.column_stack([counts, published, recency])
+    return feats, trend_hits
+
+
+def score_batch(
+    items: List[Dict], trends: List[str], config: Dict | None = None, now: dt.datetime | None = None
+) -> Tuple[np.ndarray, List[List[str]]]:
+    cfg = config or load_scoring_config()
+    w = cfg["weights"]
+    matcher = Matcher({"keyword": cfg["keyword_boost"], "trend": trends, "clickbait": cfg["clickbait_terms"]})
+    feats, trend_hits = extract_features(items, matcher, w["recency_half_life_hours"], now=now)
+    if not items:
+        return np.zeros(0, dtype=np.float64), trend_hits
+
+    linear = np.array([w["keyword"], 0.0, w["clickbait"], w["published"], w["recency"]])
+    scores = w["base"] + feats @ linear + np.minimum(w["trend_cap"], feats[:, 1] * w["trend"])
+    return scores, trend_hits
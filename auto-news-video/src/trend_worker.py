@@ -0,0 +1,178 @@
+import atexit
+import itertools
+import json
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+class TrendWorker:
+    # giữ 1 process node `--serve` sống suốt vòng đời Python, browser luôn warm
+    def __init__(self, script: Path, cwd: Path):
+        self._script = script
+        self._cwd = cwd
+        self._proc: subprocess.Popen | None = None
+        self._responses: queue.Queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            return
+        self._proc = subprocess.Popen(
+            ["node", str(self._script), "--serve"],
+            cwd=str(self._cwd),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        self._responses = queue.Queue()
+        threading.Thread(target=self._pump, args=(self._proc, self._responses), daemon=True).start()
+
+    @staticmethod
+    def _pump(proc: subprocess.Popen, responses: queue.Queue) -> None:
+        for line in proc.stdout:
+            try:
+                responses.put(json.loads(line))
+            except Exception:
+                continue
+        responses.put(None)
+
+    def request(self, timeout: float, url: str | None = None) -> Dict:
+        with self._lock:
+            self._ensure_started()
+            req_id = next(self._ids)
+            payload = {"id": req_id}
+            if url:
+                payload["url"] = url
+            self._proc.stdin.write(json.dumps(payload) + "\n")
+            self._proc.stdin.flush()
+
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"trend worker timeout after {timeout}s")
+                try:
+                    msg = self._responses.get(timeout=remaining)
+                except queue.Empty:
+                    raise TimeoutError(f"trend worker timeout after {timeout}s")
+                if msg is None:
+                    raise RuntimeError("trend worker exited")
+                # bỏ qua response trễ của request đã timeout trước đó
+                if msg.get("id") == req_id:
+                    return msg
+
+    def close(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None or proc.poll() is not None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=5)
+        except Exception:
+            proc.kill()
+
+
+class SocketTrendWorker:
+    # daemon node `--serve --socket` sống qua nhiều lần chạy pipeline (cron/run_daily mỗi lần 1 process),
+    # nên lần chạy sau vẫn gặp browser warm; daemon tự thoát khi idle lâu
+    def __init__(self, script: Path, cwd: Path, sock_path: Path):
+        self._script = script
+        self._cwd = cwd
+        self._sock_path = sock_path
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _try_connect(self, timeout: float) -> socket.socket | None:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(timeout)
+        try:
+            conn.connect(str(self._sock_path))
+            return conn
+        except OSError:
+            conn.close()
+            return None
+
+    def _connect(self, deadline: float) -> socket.socket:
+        conn = self._try_connect(max(0.1, deadline - time.monotonic()))
+        if conn is not None:
+            return conn
+        import fcntl
+
+        # self._lock chỉ chặn các thread trong process; lock file chặn 2 lần chạy (cron + run_manual_preview)
+        # cùng spawn daemon -> chỉ 1 process spawn, process kia chờ rồi connect vào daemon đó
+        self._sock_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self._sock_path.with_suffix(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            conn = self._try_connect(max(0.1, deadline - time.monotonic()))
+            if conn is not None:
+                return conn
+            subprocess.Popen(
+                ["node", str(self._script), "--serve", "--socket", str(self._sock_path)],
+                cwd=str(self._cwd),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+            while time.monotonic() < deadline:
+                time.sleep(0.1)
+                conn = self._try_connect(max(0.1, deadline - time.monotonic()))
+                if conn is not None:
+                    return conn
+        raise TimeoutError(f"trend daemon not ready at {self._sock_path}")
+
+    def request(self, timeout: float, url: str | None = None) -> Dict:
+        deadline = time.monotonic() + timeout
+        conn = self._connect(deadline)
+        with conn, conn.makefile("rw", encoding="utf-8") as f:
+            payload = {"id": next(self._ids)}
+            if url:
+                payload["url"] = url
+            f.write(json.dumps(payload) + "\n")
+            f.flush()
+            conn.settimeout(max(0.1, deadline - time.monotonic()))
+            try:
+                line = f.readline()
+            except socket.timeout:
+                raise TimeoutError(f"trend daemon timeout after {timeout}s")
+        if not line:
+            raise RuntimeError("trend daemon closed connection")
+        return json.loads(line)
+
+    def close(self) -> None:
+        # daemon cố ý không bị tắt theo process gọi
+        pass
+
+
+_WORKERS: Dict[Path, TrendWorker | SocketTrendWorker] = {}
+
+
+def fetch_trends(script: Path, cwd: Path, timeout: float, sock_path: Path | None = None) -> List[str]:
+    worker = _WORKERS.get(script)
+    if worker is None:
+        # không có unix socket + flock (vd Windows), path quá giới hạn sun_path hoặc không cấu hình socket
+        # -> worker stdio sống theo process
+        if sock_path is not None and os.name == "posix" and len(str(sock_path)) < 100:
+            worker = SocketTrendWorker(script, cwd, sock_path)
+        else:
+            worker = TrendWorker(script, cwd)
+        _WORKERS[script] = worker
+    msg = worker.request(timeout)
+    trends = msg.get("trends", [])
+    return [str(x) for x in trends] if isinstance(trends, list) else []
+
+
+@atexit.register
+def _close_workers() -> None:
+    for worker in _WORKERS.values():
+        worker.close()
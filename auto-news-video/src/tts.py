@@ -0,0 +1,232 @@
+import concurrent.futures as cf
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterator, List, Protocol, Tuple
+
+from gtts import gTTS
+
+from ffmpeg_caps import probe
+from file_cache import FileCache
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "data"
+STYLE_FILE = ROOT / "config" / "style.json"
+TTS_CACHE_DIR = DATA / "tts_cache"
+TTS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+TTS_MAX_WORKERS = 4
+
+_cache = FileCache(TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES, suffix=".mp3")
+
+
+def audio_duration_sec(path: Path, fallback: float = 45.0) -> float:
+    ffprobe = probe()["ffprobe"]
+    if not ffprobe:
+        return fallback
+    result = subprocess.run(
+        [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", str(path)],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    try:
+        return float(result.stdout.strip())
+    except Exception:
+        return fallback
+
+
+def _estimate_duration(text: str) -> float:
+    # ~2.5 từ/giây khi không đo được bằng ffprobe
+    return max(0.5, len(text.split()) / 2.5)
+
+
+class TTSBackend(Protocol):
+    name: str
+
+    def settings(self) -> Dict:
+        ...
+
+    def stream(self, text: str) -> Iterator[bytes]:
+        ...
+
+
+class GTTSBackend:
+    name = "gtts"
+
+    def __init__(self, lang: str = "vi", tld: str = "com", slow: bool = False):
+        self.lang = lang
+        self.tld = tld
+        self.slow = slow
+
+    def settings(self) -> Dict:
+        return {"engine": self.name, "lang": self.lang, "tld": self.tld, "slow": self.slow}
+
+    def stream(self, text: str) -> Iterator[bytes]:
+        yield from gTTS(text=text, lang=self.lang, tld=self.tld, slow=self.slow).stream()
+
+
+class EspeakBackend:
+    # offline, chạy CPU local: espeak-ng -> WAV -> ffmpeg encode MP3, stream qua pipe
+    name = "espeak-ng"
+
+    def __init__(self, voice: str = "vi", speed: int = 165, pitch: int = 50, binary: str = "espeak-ng"):
+        self.voice = voice
+        self.speed = int(speed)
+        self.pitch = int(pitch)
+        self.binary = binary
+
+    def settings(self) -> Dict:
+        return {"engine": self.name, "voice": self.voice, "speed": self.speed, "pitch": self.pitch}
+
+    def stream(self, text: str) -> Iterator[bytes]:
+        espeak = shutil.which(self.binary)
+        ffmpeg = probe()["ffmpeg"]
+        if not espeak or not ffmpeg:
+            raise RuntimeError(f"{self.binary} + ffmpeg are required for the offline TTS backend")
+
+        # text đưa qua stdin chứ không làm argv: câu mở đầu bằng "-" (vd "-3% ...") sẽ bị đọc thành option
+        speak = subprocess.Popen(
+            [espeak, "-v", self.voice, "-s", str(self.speed), "-p", str(self.pitch), "--stdout", "--stdin"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        # 1 câu nằm gọn trong pipe buffer -> ghi xong đóng ngay, không chặn việc đọc audio bên dưới
+        speak.stdin.write(text.encode("utf-8"))
+        speak.stdin.close()
+        enc = subprocess.Popen(
+            [ffmpeg, "-v", "error", "-f", "wav", "-i", "pipe:0", "-codec:a", "libmp3lame", "-q:a", "4", "-f", "mp3", "pipe:1"],
+            stdin=speak.stdout,
+            stdout=subprocess.PIPE,
+        )
+        speak.stdout.close()
+        while True:
+            chunk = enc.stdout.read(65536)
+            if not chunk:
+                break
+            yield chunk
+        if enc.wait() != 0 or speak.wait() != 0:
+            raise RuntimeError(f"{self.name} synthesis failed")
+
+
+BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    EspeakBackend.name: EspeakBackend,
+}
+
+
+def load_tts_config() -> Dict:
+    cfg = {"backend": "gtts", "max_workers": TTS_MAX_WORKERS, "options": {}}
+    if not STYLE_FILE.exists():
+        return cfg
+    try:
+        data = json.loads(STYLE_FILE.read_text(encoding="utf-8")).get("tts", {})
+        if isinstance(data, dict):
+            cfg["backend"] = str(data.get("backend", cfg["backend"]))
+            cfg["max_workers"] = int(data.get("max_workers", cfg["max_workers"]))
+            options = data.get(cfg["backend"], {})
+            if isinstance(options, dict):
+                cfg["options"] = options
+    except Exception:
+        pass
+    return cfg
+
+
+def load_backend(cfg: Dict | None = None) -> TTSBackend:
+    cfg = cfg or load_tts_config()
+    factory = BACKENDS.get(cfg["backend"])
+    if factory is None:
+        raise ValueError(f"Unknown TTS backend: {cfg['backend']} (available: {', '.join(BACKENDS)})")
+    return factory(**cfg["options"])
+
+
+def cache_key(text: str, settings: Dict) -> str:
+    raw = json.dumps({"text": text, "voice": settings}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _stream_to_file(backend: TTSBackend, text: str, out_path: Path) -> None:
+    # ghi dần từng chunk ra file tạm, xong mới rename để không để lại file dở
+    tmp = out_path.with_name(out_path.name + ".part")
+    try:
+        with tmp.open("wb") as f:
+            for chunk in backend.stream(text):
+                f.write(chunk)
+        tmp.replace(out_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def synthesize(text: str, out_path: Path, backend: TTSBackend | None = None) -> float:
+    # trả về duration (giây); cache hit thì bỏ qua cả gọi TTS lẫn ffprobe
+    backend = backend or load_backend()
+    key = cache_key(text, backend.settings())
+    hit = _cache.get(key)
+    if hit is not None and "duration" in hit:
+        shutil.copyfile(hit["path"], out_path)
+        return float(hit["duration"])
+
+    _stream_to_file(backend, text, out_path)
+    duration = audio_duration_sec(out_path, fallback=_estimate_duration(text))
+    _cache.put(key, out_path, {"duration": duration, "chars": len(text)})
+    return duration
+
+
+def split_sentences(lines: List[str]) -> List[str]:
+    out = []
+    for line in lines:
+        for part in re.split(r"(?<=[.!?…])\s+", line):
+            if part.strip():
+                out.append(part.strip())
+    return out
+
+
+def _concat_mp3(parts: List[Path], out_path: Path) -> None:
+    ffmpeg = probe()["ffmpeg"]
+    if ffmpeg is None:
+        # MP3 là chuỗi frame độc lập -> nối byte vẫn lossless (gTTS cũng ghép kiểu này)
+        with out_path.open("wb") as f:
+            for p in parts:
+                f.write(p.read_bytes())
+        return
+    list_file = out_path.with_suffix(".concat.txt")
+    list_file.write_text("".join(f"file '{p.resolve().as_posix()}'\n" for p in parts), encoding="utf-8")
+    try:
+        subprocess.run(
+            [ffmpeg, "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", str(list_file), "-c", "copy", str(out_path)],
+            check=True,
+        )
+    finally:
+        list_file.unlink(missing_ok=True)
+
+
+def synthesize_segments(
+    sentences: List[str],
+    out_path: Path,
+    backend: TTSBackend | None = None,
+    max_workers: int | None = None,
+) -> List[Tuple[str, float]]:
+    # TTS từng câu song song (mỗi câu cache riêng), rồi nối lại không re-encode
+    if backend is None or max_workers is None:
+        cfg = load_tts_config()
+        backend = backend or load_backend(cfg)
+        max_workers = max_workers or cfg["max_workers"]
+    if len(sentences) == 1:
+        return [(sentences[0], synthesize(sentences[0], out_path, backend=backend))]
+
+    # câu lặp lại (vd câu sau của title nằm cả ở Hook lẫn Điểm chính) chỉ TTS 1 lần, file part dùng lại khi nối
+    unique = list(dict.fromkeys(sentences))
+    work_dir = out_path.parent / f".{out_path.stem}_parts"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    parts = {s: work_dir / f"{i:03d}.mp3" for i, s in enumerate(unique)}
+    try:
+        with cf.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as pool:
+            durations = dict(zip(unique, pool.map(lambda s: synthesize(s, parts[s], backend=backend), unique)))
+        _concat_mp3([parts[s] for s in sentences], out_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return [(s, durations[s]) for s in sentences]